@@ -9,26 +9,176 @@ sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
 
 from flask import Flask, request, jsonify, render_template, Response, stream_template
 import json
+import threading
 import time
-from rmit_rag.rag import RAGPipeline
-from rmit_rag.embedder import Embedder
-from rmit_rag.vector_store import VectorStore
+from rmit_rag.rag import RAGPipeline, retrieve
+from rmit_rag.embedder import Embedder, BatchingEmbedder, select_device
+from rmit_rag.vector_store import ShardedVectorStore, open_store
+from rmit_rag.snapshots import current_version, list_snapshots, resolve_index
+from rmit_rag.runtime import page_in
+from rmit_rag.profiling import PROFILE_MODES, ProfileBusyError, profile_call, save_profile, summarize_profile
+import hmac
 from rmit_rag.config import settings
 from rmit_rag.personality import get_available_personalities
-from rmit_rag.cache import clear_cache, get_cache_stats
+from rmit_rag.cache import clear_cache, get_cache_stats, load_pregenerated
+from rmit_rag.scheduler import SchedulerError, QueueFullError
 
 app = Flask(__name__)
 
 # Initialize RAG pipeline once at startup
 pipeline = None
 
+# Background snapshot reloads (one at a time)
+_reload_lock = threading.Lock()
+_reload_state = {"status": "idle", "version": None, "error": None}
+_snapshot_poller = None
+
+def _sharded_env() -> bool:
+    return os.getenv("SHARDED", "0").lower() in {"1", "true", "yes", "on"}
+
+def _index_version(store, manifest):
+    return manifest["checksum"] if manifest else store.fingerprint()
+
+def _load_pregenerated_for(index_version, replace=False):
+    # Start hot: answers produced offline by scripts/pregenerate.py for this exact index
+    if Path(settings.response_cache_file).exists():
+        load_pregenerated(settings.response_cache_file, index_version, replace=replace)
+
+# Request threads and the warmup thread may all call init_pipeline at once
+_init_lock = threading.Lock()
+
 def init_pipeline():
     global pipeline
-    if pipeline is None:
+    if pipeline is not None:
+        return
+    with _init_lock:
+        if pipeline is not None:
+            return
+        collection = os.getenv("COLLECTION", "combined_docs")
+        store, manifest = open_store(collection, settings.chroma_dir, sharded=_sharded_env())
+        embedder = Embedder(manifest.get("embed_model", settings.embed_model) if manifest else settings.embed_model)
+        if settings.embed_microbatch:
+            # Concurrent requests share forward passes instead of running batches of one
+            embedder = BatchingEmbedder(embedder)
+        new_pipeline = RAGPipeline(collection, embedder=embedder, store=store)
+        new_pipeline.swap_store(store, _index_version(store, manifest), manifest)
+        _load_pregenerated_for(new_pipeline.index_version)
+        # Publish only once fully built so no request sees a half-initialized pipeline
+        pipeline = new_pipeline
+        _start_snapshot_poller()
+
+# Set once this process has loaded and exercised the pipeline
+_ready = threading.Event()
+
+def preload():
+    """Load shared, read-only state in the parent process before workers fork.
+
+    On CPU hosts the SentenceTransformer weights land in the module-level
+    model cache and the index files in the OS page cache, so forked workers
+    share both copy-on-write instead of each loading their own. A CUDA or
+    MPS model cannot be used from a forked child, so on GPU hosts only the
+    index is paged in and each worker loads the model onto the device itself.
+    Chroma clients hold SQLite connections and threads, which must not cross
+    a fork, so each worker opens its own in `warmup`.
+    """
+    import torch
+    # The parent only runs one warmup batch; keeping it single-threaded means no
+    # OpenMP pool exists at fork time, and workers size their own in post_fork
+    torch.set_num_threads(1)
+    path, manifest = resolve_index(settings.chroma_dir)
+    device = select_device()
+    if device == "cpu":
+        Embedder(manifest.get("embed_model", settings.embed_model) if manifest else settings.embed_model)
+        loaded = "embedder and "
+    else:
+        loaded = ""
+        app.logger.info(f"Embedding device is {device}: workers load the model after fork")
+    app.logger.info(f"Preloaded {loaded}{page_in(path)} bytes of index "
+                    f"({manifest['version'] if manifest else path})")
+
+def warmup():
+    """Initialize this process's pipeline, run one retrieval end to end, then report ready."""
+    init_pipeline()
+    _warm_store(pipeline.store, pipeline.embedder)
+    _ready.set()
+
+def _warm_store(store, embedder):
+    """Touch the new index so the first real query doesn't pay for loading it."""
+    embedding = embedder.encode(["warmup"])
+    for _ in range(3):
+        store.query(query_embeddings=embedding, n_results=1)
+
+def reload_index(version=None):
+    """Load snapshot `version` (default: CURRENT), warm it, then swap it in.
+
+    Runs on a background thread; requests keep being served from the
+    active store until the swap, which is a single reference assignment.
+    """
+    if not _reload_lock.acquire(blocking=False):
+        return
+    try:
+        _reload_state.update({"status": "loading", "version": version, "error": None})
         collection = os.getenv("COLLECTION", "combined_docs")
-        embedder = Embedder("all-MiniLM-L6-v2")
-        store = VectorStore(collection, persist_directory=settings.chroma_dir)
-        pipeline = RAGPipeline(collection, embedder=embedder, store=store)
+        store, manifest = open_store(collection, settings.chroma_dir, sharded=_sharded_env(), version=version)
+        if manifest is None:
+            raise FileNotFoundError("No published snapshot to load")
+        if pipeline.manifest and pipeline.manifest.get("version") == manifest["version"]:
+            _reload_state.update({"status": "idle", "version": manifest["version"]})
+            return
+        if manifest.get("embed_model") and manifest["embed_model"] != getattr(pipeline.embedder, "model_name", None):
+            raise ValueError(f"Snapshot {manifest['version']} was built with {manifest['embed_model']}")
+        _warm_store(store, pipeline.embedder)
+        pipeline.swap_store(store, manifest["checksum"], manifest)
+        _load_pregenerated_for(manifest["checksum"], replace=True)
+        _reload_state.update({"status": "idle", "version": manifest["version"]})
+        app.logger.info(f"Swapped in index snapshot {manifest['version']} ({manifest['count']} documents)")
+    except Exception as e:
+        _reload_state.update({"status": "error", "error": str(e)})
+        app.logger.error(f"Index reload failed: {e}")
+    finally:
+        _reload_lock.release()
+
+def _serves_unversioned_shards():
+    return pipeline is not None and pipeline.manifest is None and isinstance(pipeline.store, ShardedVectorStore)
+
+def reload_shards(sources=None):
+    """Swap in shards rebuilt in place by `make i SHARDED=1` (indexes without snapshots).
+
+    Returns:
+        Labels that changed
+    """
+    with _reload_lock:
+        store = pipeline.store
+        changed = store.refresh(sources)
+        if changed:
+            _warm_store(store, pipeline.embedder)
+            pipeline.swap_store(store, store.fingerprint(), None)
+            _load_pregenerated_for(pipeline.index_version, replace=True)
+            app.logger.info(f"Reloaded shards: {', '.join(changed)}")
+        return changed
+
+def _start_snapshot_poller():
+    """Follow CURRENT (or rebuilt shards of an unversioned index) when SNAPSHOT_POLL_SECONDS is set."""
+    global _snapshot_poller
+    interval = float(os.getenv("SNAPSHOT_POLL_SECONDS", "0") or 0)
+    if interval <= 0 or _snapshot_poller is not None:
+        return
+
+    def _poll():
+        while True:
+            time.sleep(interval)
+            try:
+                latest = current_version(settings.chroma_dir)
+                active = pipeline.manifest.get("version") if pipeline and pipeline.manifest else None
+                if latest and latest != active:
+                    reload_index(latest)
+                elif latest is None and _serves_unversioned_shards():
+                    reload_shards()
+            except Exception as e:
+                app.logger.error(f"Snapshot poll failed: {e}")
+
+    _snapshot_poller = threading.Thread(target=_poll, name="snapshot-poller", daemon=True)
+    _snapshot_poller.start()
 
 @app.route("/")
 def index():
@@ -48,30 +198,87 @@ def ask_question():
         question = data.get("question", "").strip()
         k = int(data.get("k", 3))  # Default to 3 for faster responses
         stream = data.get("stream", False)
+        sources = data.get("sources") or None  # optional source labels to search (sharded indexes)
         
         if not question:
             return jsonify({"error": "Question is required"}), 400
+        if sources is not None and (
+            not isinstance(sources, list) or not all(isinstance(source, str) for source in sources)
+        ):
+            return jsonify({"error": "sources must be a list of source labels"}), 400
         
         init_pipeline()
         
+        # Sending "session_id" (null to start one) opts into a multi-turn conversation
+        session = pipeline.sessions.get_or_create(data.get("session_id")) if "session_id" in data else None
+        
         if stream:
-            return Response(stream_with_question(question, k), mimetype='application/json')
+            return Response(stream_with_question(question, k, sources, session), mimetype='application/json')
         else:
+            profile_mode = _requested_profile_mode()
             start_time = time.time()
-            answer = pipeline.query(question, n_results=k)
+            if profile_mode:
+                result, artifact = profile_call(
+                    pipeline.query_detailed, question, n_results=k, sources=sources, session=session, mode=profile_mode
+                )
+            else:
+                result = pipeline.query_detailed(question, n_results=k, sources=sources, session=session)
             end_time = time.time()
             
-            return jsonify({
+            response = {
                 "question": question,
-                "answer": answer,
+                "answer": result["answer"],
                 "k": k,
+                "fast_path": result["fast_path"],
+                "cached": result["cached"],
+                "fallback": result["fallback"],
                 "response_time": round(end_time - start_time, 2)
-            })
+            }
+            if session is not None:
+                response.update({"session_id": result["session_id"], "followup": result["followup"]})
+            if profile_mode:
+                response["profile"] = summarize_profile(artifact)
+                # Only the file name: the server's directory layout stays private
+                response["profile"]["artifact"] = save_profile(artifact, settings.profile_dir, keep=settings.profile_keep).name
+            return jsonify(response)
     
+    except ProfileBusyError as e:
+        return jsonify({"error": str(e)}), 409
+    except SchedulerError as e:
+        return _overloaded(e)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-def stream_with_question(question, k):
+def _requested_profile_mode():
+    """Profile mode asked for via the X-Profile header, if profiling is enabled and authorized.
+
+    `X-Profile: 1|sampling|deterministic` is ignored unless PROFILE_ENABLED is
+    set, PROFILE_TOKEN is configured and X-Profile-Token matches it.
+    """
+    requested = request.headers.get("X-Profile", "").strip().lower()
+    if not requested or not settings.profile_enabled:
+        return None
+    # Profiling turns on process-wide tracemalloc and writes files, so it is never open to anyone
+    if not settings.profile_token or not hmac.compare_digest(
+        request.headers.get("X-Profile-Token", ""), settings.profile_token
+    ):
+        return None
+    if requested in {"1", "true", "yes", "on"}:
+        return "sampling"
+    return requested if requested in PROFILE_MODES else None
+
+def _overloaded(e):
+    """429 when the generation queue is full; 503 when a queue wait expired.
+
+    The 503 only happens with GENERATION_DEADLINE=0: with a deadline, an
+    expired wait is answered with the extractive fallback instead.
+    """
+    code = 429 if isinstance(e, QueueFullError) else 503
+    response = jsonify({"error": str(e), "retry_after": e.retry_after})
+    response.headers["Retry-After"] = str(e.retry_after)
+    return response, code
+
+def stream_with_question(question, k, sources=None, session=None):
     """Stream the response for better perceived performance."""
     try:
         start_time = time.time()
@@ -84,18 +291,20 @@ def stream_with_question(question, k):
         yield f"data: {json.dumps({'type': 'status', 'message': 'Searching knowledge base...'})}\n\n"
         
         # Query vector store
-        results = pipeline.store.query(query_embeddings=query_embedding, n_results=k)
+        results = retrieve(pipeline.store, query_embedding, k, sources)
         context = " ".join(results["documents"][0]) if results and results.get("documents") else ""
         
         yield f"data: {json.dumps({'type': 'status', 'message': 'Generating response...'})}\n\n"
         
         # Generate response
-        answer = pipeline.query(question, n_results=k)
+        result = pipeline.query_detailed(question, n_results=k, sources=sources, session=session)
         end_time = time.time()
         
         # Send final result
-        yield f"data: {json.dumps({'type': 'complete', 'answer': answer, 'response_time': round(end_time - start_time, 2)})}\n\n"
+        yield f"data: {json.dumps({'type': 'complete', 'answer': result['answer'], 'fast_path': result['fast_path'], 'cached': result['cached'], 'fallback': result['fallback'], 'session_id': result.get('session_id'), 'response_time': round(end_time - start_time, 2)})}\n\n"
         
+    except SchedulerError as e:
+        yield f"data: {json.dumps({'type': 'error', 'error': str(e), 'retry_after': e.retry_after})}\n\n"
     except Exception as e:
         yield f"data: {json.dumps({'type': 'error', 'error': str(e)})}\n\n"
 
@@ -109,6 +318,81 @@ def status():
         "temperature": settings.temperature
     })
 
+@app.route("/api/ready")
+def ready():
+    """Readiness probe: 200 only once this worker has warmed its pipeline."""
+    if not _ready.is_set():
+        return jsonify({"ready": False}), 503
+    return jsonify({
+        "ready": True,
+        "pid": os.getpid(),
+        "index_version": pipeline.index_version if pipeline else None,
+    })
+
+@app.route("/api/index", methods=["GET"])
+def index_info():
+    """Active index snapshot, reload progress and available snapshots."""
+    init_pipeline()
+    return jsonify({
+        "active": pipeline.manifest,
+        "index_version": pipeline.index_version,
+        "current": current_version(settings.chroma_dir),
+        "reload": dict(_reload_state),
+        "snapshots": [m["version"] for m in list_snapshots(settings.chroma_dir)],
+    })
+
+@app.route("/api/index/reload", methods=["POST"])
+def reload_index_snapshot():
+    """Load a snapshot in the background and hot-swap it in once warm.
+
+    For a sharded index built without snapshots, rebuilt shards (optionally
+    only `{"shards": [...]}`) are swapped in before responding.
+    """
+    try:
+        init_pipeline()
+        data = request.get_json(silent=True) or {}
+        requested = data.get("version")
+        if requested is not None and requested not in [m["version"] for m in list_snapshots(settings.chroma_dir)]:
+            # Only published snapshot names; never a client-chosen path
+            return jsonify({"error": f"Unknown snapshot version: {requested}"}), 404
+        version = requested or current_version(settings.chroma_dir)
+        if version is None:
+            if _serves_unversioned_shards():
+                shards = data.get("shards") or None
+                if shards is not None and (
+                    not isinstance(shards, list) or not all(isinstance(label, str) for label in shards)
+                ):
+                    return jsonify({"error": "shards must be a list of source labels"}), 400
+                return jsonify({"status": "ok", "reloaded": reload_shards(shards)})
+            return jsonify({"error": "No published snapshot to load"}), 404
+        if _reload_lock.locked():
+            return jsonify({"status": "busy", "reload": dict(_reload_state)}), 409
+        threading.Thread(target=reload_index, args=(version,), name="index-reload", daemon=True).start()
+        return jsonify({"status": "loading", "version": version}), 202
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/api/session/<session_id>", methods=["DELETE"])
+def end_session(session_id):
+    """Forget a multi-turn session."""
+    init_pipeline()
+    return jsonify({"deleted": pipeline.sessions.delete(session_id)})
+
+@app.route("/api/sessions/stats", methods=["GET"])
+def session_statistics():
+    """Get session store statistics."""
+    init_pipeline()
+    return jsonify(pipeline.sessions.stats())
+
+@app.route("/api/scheduler/stats", methods=["GET"])
+def scheduler_statistics():
+    """Get generation queue depth, in-flight count and wait times."""
+    init_pipeline()
+    stats = pipeline.scheduler.stats()
+    if isinstance(pipeline.embedder, BatchingEmbedder):
+        stats["embedding"] = pipeline.embedder.stats()
+    return jsonify(stats)
+
 @app.route("/api/personalities")
 def personalities():
     """Get available personality types."""
@@ -116,7 +400,12 @@ def personalities():
 
 @app.route("/api/config", methods=["POST"])
 def update_config():
-    """Update personality and temperature settings."""
+    """Update personality and temperature settings.
+
+    `settings` is read once at import, so the values are recorded in the
+    environment for the next start; the running pipeline (its generation
+    queue, sessions and embedding batcher) is left untouched.
+    """
     try:
         data = request.get_json()
         
@@ -125,16 +414,12 @@ def update_config():
             os.environ["PERSONALITY_LEVEL"] = data["personality"]
         if "temperature" in data:
             os.environ["TEMPERATURE"] = str(data["temperature"])
-            
-        # Reinitialize pipeline with new settings
-        global pipeline
-        pipeline = None
-        init_pipeline()
         
         return jsonify({
             "status": "ok",
             "personality": os.environ.get("PERSONALITY_LEVEL", "friendly"),
-            "temperature": float(os.environ.get("TEMPERATURE", "0.4"))
+            "temperature": float(os.environ.get("TEMPERATURE", "0.4")),
+            "applies_on_restart": True,
         })
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -157,8 +442,11 @@ def get_cache_statistics():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+if settings.profile_enabled and not settings.profile_token:
+    app.logger.warning("PROFILE_ENABLED is set without PROFILE_TOKEN; profiling requests will be ignored")
+
 if __name__ == "__main__":
-    init_pipeline()
+    warmup()
     port = int(os.getenv("PORT", 8000))
     debug = os.getenv("FLASK_DEBUG", "false").lower() == "true"
     app.run(host="0.0.0.0", port=port, debug=debug)
@@ -0,0 +1,69 @@
+"""Production server settings: `make serve` (gunicorn -c api/gunicorn.conf.py).
+
+The app is imported once in the master (`preload_app`), which loads the
+embedding model and pages in the index before forking, so workers share
+those pages copy-on-write. Each worker then gets its own slice of the CPU
+for torch/BLAS and warms its own pipeline before `/api/ready` reports 200.
+"""
+
+import os
+import sys
+import threading
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+
+from rmit_rag.runtime import apply_thread_budget, set_thread_env, thread_budget  # noqa: E402
+
+pythonpath = f"{ROOT / 'api'},{ROOT / 'src'}"
+wsgi_app = "app:app"
+bind = f"0.0.0.0:{os.getenv('PORT', '3000')}"
+# Sessions, the response cache and index reloads live in each worker's memory and gunicorn
+# has no sticky routing, so one worker is the default; more need a session-affine proxy
+workers = int(os.getenv("WEB_WORKERS", "1"))
+# Threads per worker serve concurrent requests while one waits on Ollama
+worker_class = "gthread"
+threads = int(os.getenv("WEB_THREADS", "8"))
+timeout = int(os.getenv("WEB_TIMEOUT", "120"))
+preload_app = True
+
+# 0 = split the cores evenly across workers
+torch_threads = int(os.getenv("TORCH_THREADS", "0") or 0) or thread_budget(workers)
+
+# BLAS/OpenMP read these once when loaded, which happens during preload in the master
+set_thread_env(torch_threads)
+
+# POST /api/index/reload only reaches one worker; polling CURRENT keeps every worker current
+os.environ.setdefault("SNAPSHOT_POLL_SECONDS", "30")
+
+
+def on_starting(server):
+    server.log.info(f"Starting {workers} worker(s) x {threads} thread(s), {torch_threads} torch thread(s) each")
+    if workers > 1:
+        server.log.warning("Sessions are per worker: route each session_id to the same worker for multi-turn chat")
+
+
+def when_ready(server):
+    # Still in the master, after the app import and before the first fork
+    import app as web
+
+    web.preload()
+
+
+def post_fork(server, worker):
+    apply_thread_budget(torch_threads)
+
+
+def post_worker_init(worker):
+    import app as web
+
+    # Warm in the background so the worker already answers /api/ready (503) meanwhile
+    def _warm():
+        try:
+            web.warmup()
+            worker.log.info(f"Worker {worker.pid} ready")
+        except Exception as e:
+            worker.log.error(f"Worker {worker.pid} warmup failed: {e}")
+
+    threading.Thread(target=_warm, name="warmup", daemon=True).start()
@@ -1,10 +1,12 @@
 #!/usr/bin/env python
 from __future__ import annotations
 import os
+import sys
 from rmit_rag.rag import RAGPipeline
 from rmit_rag.embedder import Embedder
-from rmit_rag.vector_store import VectorStore
+from rmit_rag.vector_store import open_store
 from rmit_rag.config import settings
+from rmit_rag.profiling import PROFILE_MODES, profile_call, save_profile
 
 
 def _get_env(name: str, default: str | None = None) -> str | None:
@@ -20,13 +22,29 @@ def main() -> None:
     except Exception:
         k = 5
 
-    embedder = Embedder("all-MiniLM-L6-v2")
-    store = VectorStore(collection, persist_directory=settings.chroma_dir)
+    sharded = (_get_env("SHARDED", "0") or "0").lower() in {"1", "true", "yes", "on"}
+    store, manifest = open_store(collection, settings.chroma_dir, sharded=sharded)
+    embedder = Embedder(manifest.get("embed_model", settings.embed_model) if manifest else settings.embed_model)
     pipeline = RAGPipeline(collection, embedder=embedder, store=store)
 
+    # PROFILE=1|sampling|deterministic profiles each question and writes an artifact to PROFILE_DIR
+    profile_mode = (_get_env("PROFILE", "") or "").lower()
+    if profile_mode in {"1", "true", "yes", "on"}:
+        profile_mode = "sampling"
+    if profile_mode and profile_mode not in PROFILE_MODES:
+        raise SystemExit(f"ERROR: PROFILE must be one of {PROFILE_MODES}")
+
+    def _ask(text: str) -> str:
+        if not profile_mode:
+            return pipeline.query(text, n_results=k)
+        answer, artifact = profile_call(pipeline.query, text, n_results=k, mode=profile_mode)
+        path = save_profile(artifact, settings.profile_dir)
+        print(f"[profile] {artifact['wall_time_ms']} ms, peak {artifact['peak_kb']} KiB -> {path}", file=sys.stderr)
+        return answer
+
     question = _get_env("QUESTION", None)
     if question:
-        print(pipeline.query(question, n_results=k))
+        print(_ask(question))
         return
 
     # REPL loop
@@ -40,7 +58,7 @@ def main() -> None:
                 continue
             if user_input.lower() in {"exit", "quit", ":q", "q"}:
                 break
-            answer = pipeline.query(user_input, n_results=k)
+            answer = _ask(user_input)
             print(answer)
     except KeyboardInterrupt:
         pass
@@ -2,15 +2,37 @@
 from __future__ import annotations
 import json
 import os
+import random
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from rmit_rag.data_loader import (
-    load_qa_csv,
-    qa_dataframe_to_documents,
+    QA_EXTENSIONS,
+    load_qa_table,
+    qa_table_to_documents,
 )
 from rmit_rag.rag import RAGPipeline
 from rmit_rag.ingestion import ingest_documents
 from rmit_rag.config import settings
 from rmit_rag.preprocess import clean_documents_and_metadatas
+from rmit_rag.vector_store import VectorStore, ShardedVectorStore, shard_label
+from rmit_rag.projection import (
+    REDUCTION_MODES,
+    PCAProjection,
+    TruncateProjection,
+    load_projection,
+    projection_path,
+)
+from rmit_rag.snapshots import (
+    MANIFEST_FILE,
+    current_version,
+    new_snapshot,
+    prune_snapshots,
+    publish,
+    resolve_index,
+    write_manifest,
+)
 
 
 def _get_env(name: str, default: str | None = None) -> str | None:
@@ -34,6 +56,100 @@ def parse_qa_specs(raw: str | None) -> list[tuple[Path, str]]:
     return specs
 
 
+def _load_documents(path: Path, label: str, qa_mode: str) -> tuple[list[str], list[dict]]:
+    """Read one Q&A file (format chosen by extension) into documents and metadatas."""
+    table = load_qa_table(path, source_label=label)
+    return qa_table_to_documents(table, mode=qa_mode)
+
+
+def _configure_reduction(embedder, documents: list[str], path: Path, keep_existing: bool = False) -> dict:
+    """Set up EMBED_REDUCTION for this build and save the projection next to the index.
+
+    PCA is fitted on (a sample of) the corpus embeddings; truncation keeps the
+    leading EMBED_DIM dimensions of a Matryoshka model. The saved projection
+    is what the vector store applies to full-size query embeddings.
+
+    With `keep_existing` (vectors from an earlier build stay in the index),
+    the saved projection (or its absence) is authoritative: it is reused when
+    EMBED_REDUCTION/EMBED_DIM are unset, and a conflicting request is refused
+    instead of mixing vector sizes in one index.
+    """
+    requested_mode = (_get_env("EMBED_REDUCTION") or "").lower() or None
+    requested_dim = _get_env("EMBED_DIM")
+    if requested_mode is not None and requested_mode not in REDUCTION_MODES:
+        raise SystemExit(f"ERROR: EMBED_REDUCTION must be one of {REDUCTION_MODES}")
+
+    if keep_existing:
+        existing = load_projection(path)
+        saved_mode = existing.kind if existing is not None else "none"
+        mode = requested_mode or saved_mode
+        conflict = mode != saved_mode or (
+            existing is not None and requested_dim is not None and int(requested_dim) != existing.dim
+        )
+        if conflict:
+            saved = f"{saved_mode} ({existing.dim} dims)" if existing is not None else "none"
+            raise SystemExit(
+                f"ERROR: The index was built with EMBED_REDUCTION={saved}; changing the reduction "
+                "needs a full rebuild (CLEAR=1, or SNAPSHOT=1 CLEAR=1)."
+            )
+        embedder.projection = existing
+        if existing is None:
+            return {"reduction": "none"}
+        return {"reduction": existing.kind, "embed_dim": existing.dim, "input_dim": existing.input_dim}
+
+    mode = requested_mode or settings.embed_reduction.lower()
+    if mode not in REDUCTION_MODES:
+        raise SystemExit(f"ERROR: EMBED_REDUCTION must be one of {REDUCTION_MODES}")
+    if mode == "none":
+        # A projection left over from an earlier reduced build would mangle queries
+        path.unlink(missing_ok=True)
+        embedder.projection = None
+        return {"reduction": "none"}
+    if not documents:
+        raise SystemExit("ERROR: No documents to fit the embedding reduction on.")
+
+    sample = documents
+    if mode == "truncate":
+        sample = documents[:1]
+    elif len(documents) > settings.embed_pca_sample:
+        sample = random.Random(0).sample(documents, settings.embed_pca_sample)
+    full = embedder.encode(sample)
+    input_dim = len(full[0])
+    if settings.embed_dim >= input_dim:
+        raise SystemExit(f"ERROR: EMBED_DIM={settings.embed_dim} must be below the model's {input_dim} dimensions.")
+    if mode == "pca":
+        projection = PCAProjection.fit(full, settings.embed_dim)
+    else:
+        projection = TruncateProjection(settings.embed_dim, input_dim)
+    projection.save(path)
+    embedder.projection = projection
+    return {"reduction": mode, "embed_dim": projection.dim, "input_dim": projection.input_dim}
+
+
+def _preprocess(docs: list[str], metas: list[dict]) -> tuple[list[str], list[dict]]:
+    """Apply optional cleaning controlled by the PREPROCESS* environment variables."""
+    enable_pre = _get_env("PREPROCESS", "0") or "0"
+    if str(enable_pre).lower() not in {"1", "true", "yes", "on"}:
+        return docs, metas
+    to_lower = ( _get_env("PRE_TO_LOWER", "1") or "1" ).lower() in {"1","true","yes","on"}
+    strip_controls = ( _get_env("PRE_STRIP_CONTROLS", "1") or "1" ).lower() in {"1","true","yes","on"}
+    normalize_spaces = ( _get_env("PRE_NORMALIZE_SPACES", "1") or "1" ).lower() in {"1","true","yes","on"}
+    min_length_raw = _get_env("PRE_MIN_LENGTH", "0") or "0"
+    try:
+        min_length = int(min_length_raw)
+    except Exception:
+        min_length = 0
+    cleaned_docs, cleaned_metas = clean_documents_and_metadatas(
+        docs,
+        metas,
+        to_lower=to_lower,
+        strip_controls=strip_controls,
+        normalize_spaces=normalize_spaces,
+        min_length=min_length,
+    )
+    return cleaned_docs, cleaned_metas or []
+
+
 def main() -> None:
     collection = _get_env("COLLECTION", "combined_docs") or "combined_docs"
     qa_raw = _get_env("QA", None)  # comma-separated: path[:label],path2[:label2]
@@ -45,50 +161,121 @@ def main() -> None:
 
     qa_specs = parse_qa_specs(qa_raw)
     if not qa_specs:
-        # Auto-discover all CSVs in DATA_DIR; label by filename stem
+        # Auto-discover all Q&A files (CSV, Parquet, Arrow, Excel) in DATA_DIR; label by filename stem
         if not data_dir.exists() or not data_dir.is_dir():
             raise SystemExit(f"ERROR: DATA_DIR not found: {data_dir}")
-        discovered = sorted(data_dir.glob("*.csv"))
+        discovered = sorted(p for p in data_dir.iterdir() if p.is_file() and p.suffix.lower() in QA_EXTENSIONS)
         if not discovered:
-            raise SystemExit("ERROR: No QA provided and no CSVs found in DATA_DIR.")
+            raise SystemExit("ERROR: No QA provided and no Q&A files found in DATA_DIR.")
         qa_specs = [(p, p.stem) for p in discovered]
 
-    combined_docs: list[str] = []
-    combined_metas: list[dict] = []
+    sharded = (_get_env("SHARDED", "0") or "0").lower() in {"1", "true", "yes", "on"}
+    snapshot = (_get_env("SNAPSHOT", "0") or "0").lower() in {"1", "true", "yes", "on"}
 
-    for path, label in qa_specs:
-        qa_df = load_qa_csv(path, source_label=label)
-        qa_docs, qa_metas = qa_dataframe_to_documents(qa_df, mode=qa_mode)
-        combined_docs.extend(qa_docs)
-        combined_metas.extend(qa_metas)
+    persist_dir: Path = Path(settings.chroma_dir)
+    version: str | None = None
+    if snapshot:
+        # Build into a fresh, never-served directory; the API only sees it once published
+        version, persist_dir = new_snapshot(settings.chroma_dir)
+        current = current_version(settings.chroma_dir)
+        if sharded and not clear and current is not None:
+            # Carry the untouched shards over so a single-shard rebuild yields a complete snapshot
+            base_path, _ = resolve_index(settings.chroma_dir, current)
+            shutil.copytree(base_path, persist_dir, dirs_exist_ok=True,
+                            ignore=shutil.ignore_patterns(MANIFEST_FILE))
 
-    pipeline = RAGPipeline(collection)
-    if clear:
-        pipeline.store.clear()
+    if sharded:
+        # One collection per source label; only the labels being built are rewritten
+        groups: dict[str, tuple[list[str], list[dict]]] = {}
+        for path, label in qa_specs:
+            qa_docs, qa_metas = _load_documents(path, label, qa_mode)
+            docs, metas = groups.setdefault(shard_label(label), ([], []))
+            docs.extend(qa_docs)
+            metas.extend(qa_metas)
 
-    # Optional preprocessing
-    enable_pre = _get_env("PREPROCESS", "0") or "0"
-    if str(enable_pre).lower() in {"1", "true", "yes", "on"}:
-        to_lower = ( _get_env("PRE_TO_LOWER", "1") or "1" ).lower() in {"1","true","yes","on"}
-        strip_controls = ( _get_env("PRE_STRIP_CONTROLS", "1") or "1" ).lower() in {"1","true","yes","on"}
-        normalize_spaces = ( _get_env("PRE_NORMALIZE_SPACES", "1") or "1" ).lower() in {"1","true","yes","on"}
-        min_length_raw = _get_env("PRE_MIN_LENGTH", "0") or "0"
-        try:
-            min_length = int(min_length_raw)
-        except Exception:
-            min_length = 0
-        combined_docs, combined_metas = clean_documents_and_metadatas(
+        groups = {label: _preprocess(docs, metas) for label, (docs, metas) in groups.items()}
+
+        store = ShardedVectorStore(collection, persist_directory=persist_dir)
+        pipeline = RAGPipeline(collection, store=store)
+        # Untouched shards were embedded with the existing projection, so it stays unless rebuilding everything
+        untouched = 0 if clear else sum(
+            shard.collection.count() for label, shard in store.shards.items() if label not in groups
+        )
+        reduction = _configure_reduction(
+            pipeline.embedder,
+            [doc for docs, _ in groups.values() for doc in docs],
+            projection_path(persist_dir, collection),
+            keep_existing=untouched > 0,
+        )
+
+        def _build_shard(label: str) -> int:
+            docs, metas = groups[label]
+            if not docs:
+                store.drop_shard(label)
+                return 0
+            # Build beside the served collection; running servers keep using it until they refresh
+            shard = store.new_shard(label)
+            ingest_documents(embedder=pipeline.embedder, store=shard, documents=docs, metadatas=metas)
+            store.swap_shard(label, shard)
+            store.prune_shard(label)
+            return len(docs)
+
+        workers = int(_get_env("SHARD_WORKERS", "4") or "4")
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            counts = dict(zip(groups, pool.map(_build_shard, groups)))
+        if clear:
+            for label in store.shards:
+                if label not in groups:
+                    store.drop_shard(label)
+        summary = {"status": "ok", "collection": collection, "sharded": True, "shards": counts,
+                   "count": sum(counts.values()), "persist": str(persist_dir)}
+    else:
+        combined_docs: list[str] = []
+        combined_metas: list[dict] = []
+
+        for path, label in qa_specs:
+            qa_docs, qa_metas = _load_documents(path, label, qa_mode)
+            combined_docs.extend(qa_docs)
+            combined_metas.extend(qa_metas)
+
+        store = VectorStore(collection, persist_directory=persist_dir)
+        pipeline = RAGPipeline(collection, store=store)
+        if clear:
+            pipeline.store.clear()
+
+        combined_docs, combined_metas = _preprocess(combined_docs, combined_metas)
+        # Upserting into a populated collection has to keep its vector size
+        reduction = _configure_reduction(
+            pipeline.embedder,
             combined_docs,
-            combined_metas,
-            to_lower=to_lower,
-            strip_controls=strip_controls,
-            normalize_spaces=normalize_spaces,
-            min_length=min_length,
+            projection_path(persist_dir, collection),
+            keep_existing=pipeline.store.collection.count() > 0,
         )
 
-    # Use the ingestion function for clearer separation of concerns
-    ingest_documents(embedder=pipeline.embedder, store=pipeline.store, documents=combined_docs, metadatas=combined_metas)
-    print(json.dumps({"status": "ok", "collection": collection, "count": len(combined_docs), "persist": settings.chroma_dir}))
+        # Use the ingestion function for clearer separation of concerns
+        ingest_documents(embedder=pipeline.embedder, store=pipeline.store, documents=combined_docs, metadatas=combined_metas)
+        summary = {"status": "ok", "collection": collection, "count": len(combined_docs), "persist": str(persist_dir)}
+
+    if snapshot:
+        manifest = {
+            "version": version,
+            "collection": collection,
+            "embed_model": getattr(pipeline.embedder, "model_name", settings.embed_model),
+            **reduction,
+            "count": len(store.get_all().get("ids") or []),
+            "checksum": store.fingerprint(),
+            "sharded": sharded,
+            "qa_mode": qa_mode,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        }
+        write_manifest(persist_dir, manifest)
+        if (_get_env("PUBLISH", "1") or "1").lower() in {"1", "true", "yes", "on"}:
+            publish(settings.chroma_dir, version)
+        keep = int(_get_env("KEEP_SNAPSHOTS", "3") or "3")
+        summary.update({"version": version, "checksum": manifest["checksum"],
+                        "pruned": prune_snapshots(settings.chroma_dir, keep)})
+    summary.update(reduction)
+    print(json.dumps(summary))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+from __future__ import annotations
+import json
+import os
+import time
+from pathlib import Path
+import numpy as np
+from rmit_rag.data_loader import QA_EXTENSIONS, load_qa_table, qa_table_to_documents
+from rmit_rag.embedder import Embedder
+from rmit_rag.config import settings
+from rmit_rag.projection import PCAProjection, TruncateProjection
+
+
+def _get_env(name: str, default: str | None = None) -> str | None:
+    value = os.environ.get(name)
+    return value if value is not None and value != "" else default
+
+
+def _search(doc_vectors: np.ndarray, query_vectors: np.ndarray, k: int) -> tuple[np.ndarray, float]:
+    """Exact top-k by cosine; returns (indices, mean seconds per query)."""
+    start = time.perf_counter()
+    scores = query_vectors @ doc_vectors.T
+    top = np.argpartition(-scores, kth=min(k, scores.shape[1] - 1), axis=1)[:, :k]
+    elapsed = time.perf_counter() - start
+    return top, elapsed / len(query_vectors)
+
+
+def main() -> None:
+    """Compare recall@K, vector memory and search time of reduced embeddings against the full ones.
+
+    Every CSV question is used as a query; a hit means its own row is in the top K.
+    """
+    data_dir = Path(_get_env("DATA_DIR", "./data") or "./data")
+    qa_mode = _get_env("QA_MODE", "concat") or "concat"
+    k = int(_get_env("K", "5") or "5")
+    dims = [int(d) for d in (_get_env("EVAL_DIMS", "64,128,192") or "64,128,192").split(",") if d.strip()]
+    modes = [m.strip() for m in (_get_env("EVAL_MODES", "pca,truncate") or "pca,truncate").split(",") if m.strip()]
+
+    documents: list[str] = []
+    questions: list[str] = []
+    for path in sorted(p for p in data_dir.iterdir() if p.is_file() and p.suffix.lower() in QA_EXTENSIONS):
+        docs, metas = qa_table_to_documents(load_qa_table(path, source_label=path.stem), mode=qa_mode)
+        documents.extend(docs)
+        questions.extend(meta["question"] for meta in metas)
+    if not documents:
+        raise SystemExit(f"ERROR: No Q&A files found in {data_dir}")
+
+    embedder = Embedder(settings.embed_model)
+    full_docs = np.asarray(embedder.encode(documents), dtype=np.float32)
+    full_queries = np.asarray(embedder.encode(questions), dtype=np.float32)
+    truth = np.arange(len(documents))[:, None]
+
+    def _report(name: str, doc_vectors: np.ndarray, query_vectors: np.ndarray, baseline: dict | None) -> dict:
+        top, per_query = _search(doc_vectors, query_vectors, k)
+        row = {
+            "config": name,
+            "dim": int(doc_vectors.shape[1]),
+            f"recall@{k}": round(float((top == truth).any(axis=1).mean()), 4),
+            "vector_mb": round(doc_vectors.nbytes / 1e6, 3),
+            "search_us_per_query": round(per_query * 1e6, 1),
+        }
+        if baseline is not None:
+            row["recall_change"] = round(row[f"recall@{k}"] - baseline[f"recall@{k}"], 4)
+            row["memory_saving"] = round(1 - row["vector_mb"] / baseline["vector_mb"], 3)
+            row["search_speedup"] = round(baseline["search_us_per_query"] / max(row["search_us_per_query"], 1e-9), 2)
+        print(json.dumps(row))
+        return row
+
+    print(json.dumps({"model": settings.embed_model, "documents": len(documents), "queries": len(questions), "k": k}))
+    baseline = _report("full", full_docs, full_queries, None)
+    input_dim = full_docs.shape[1]
+    for mode in modes:
+        for dim in dims:
+            if dim >= input_dim:
+                continue
+            if mode == "pca":
+                projection = PCAProjection.fit(full_docs, dim)
+            elif mode == "truncate":
+                projection = TruncateProjection(dim, input_dim)
+            else:
+                raise SystemExit(f"ERROR: Unknown EVAL_MODES entry: {mode}")
+            _report(
+                f"{mode}-{dim}",
+                np.asarray(projection.transform(full_docs), dtype=np.float32),
+                np.asarray(projection.transform(full_queries), dtype=np.float32),
+                baseline,
+            )
+
+
+if __name__ == "__main__":
+    main()
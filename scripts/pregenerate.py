@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+from __future__ import annotations
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from rmit_rag.rag import RAGPipeline, build_context
+from rmit_rag.embedder import Embedder
+from rmit_rag.vector_store import open_store
+from rmit_rag.config import settings
+from rmit_rag.personality import get_available_personalities
+from rmit_rag.cache import read_cache_file, append_cache_entries
+from rmit_rag.scheduler import GenerationScheduler, PRIORITY_LOW
+
+
+def _get_env(name: str, default: str | None = None) -> str | None:
+    value = os.environ.get(name)
+    return value if value is not None and value != "" else default
+
+
+def _get_int(name: str, default: int) -> int:
+    try:
+        return int(_get_env(name, str(default)) or default)
+    except Exception:
+        return default
+
+
+def main() -> None:
+    collection = _get_env("COLLECTION", "combined_docs") or "combined_docs"
+    k = _get_int("K", 3)
+    concurrency = max(1, _get_int("CONCURRENCY", 4))
+    cache_file = _get_env("RESPONSE_CACHE_FILE", settings.response_cache_file) or settings.response_cache_file
+    personalities_raw = _get_env("PERSONALITIES", None)
+    personalities = (
+        [p.strip() for p in personalities_raw.split(",") if p.strip()]
+        if personalities_raw
+        else list(get_available_personalities())
+    )
+
+    sharded = (_get_env("SHARDED", "0") or "0").lower() in {"1", "true", "yes", "on"}
+    store, manifest = open_store(collection, settings.chroma_dir, sharded=sharded)
+    embedder = Embedder(manifest.get("embed_model", settings.embed_model) if manifest else settings.embed_model)
+    pipeline = RAGPipeline(collection, embedder=embedder, store=store)
+    index_version = manifest["checksum"] if manifest else store.fingerprint()
+
+    # Every distinct question in the index, in stored order
+    questions: list[str] = []
+    seen: set[str] = set()
+    for meta in store.get_all().get("metadatas") or []:
+        question = (meta or {}).get("question")
+        if question and question not in seen:
+            seen.add(question)
+            questions.append(question)
+    if not questions:
+        raise SystemExit(f"ERROR: No questions found in collection '{collection}'.")
+
+    # Resume: skip pairs already checkpointed for this index version
+    done = {(e["question"], e.get("personality")) for e in read_cache_file(cache_file, index_version)}
+    jobs = [(q, p) for q in questions for p in personalities if (q, p) not in done]
+    pending = list(dict.fromkeys(q for q, _ in jobs))
+    total = len(questions) * len(personalities)
+    print(json.dumps({"status": "start", "collection": collection, "index_version": index_version,
+                      "questions": len(questions), "personalities": personalities,
+                      "done": total - len(jobs), "total": total}))
+
+    # Retrieve contexts in embedding-sized batches, mirroring the live query path
+    contexts: dict[str, str] = {}
+    batch_size = embedder.batch_size
+    for start in range(0, len(pending), batch_size):
+        batch = pending[start:start + batch_size]
+        results = store.query(query_embeddings=embedder.encode(batch), n_results=k)
+        for i, question in enumerate(batch):
+            contexts[question] = build_context(results, i)
+
+    # Offline run: CONCURRENCY sets the LLM parallelism and nothing is ever rejected
+    pipeline.scheduler = GenerationScheduler(max_concurrency=concurrency, max_queue=max(1, len(jobs)), queue_timeout=None)
+    completed = failed = 0
+    start_time = time.time()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = {
+            pool.submit(pipeline.generate, question, contexts[question], personality, PRIORITY_LOW): (question, personality)
+            for question, personality in jobs
+        }
+        for future in as_completed(futures):
+            question, personality = futures[future]
+            try:
+                answer = future.result()
+            except Exception as e:
+                failed += 1
+                print(json.dumps({"status": "error", "question": question, "personality": personality, "error": str(e)}))
+                continue
+            # Checkpoint each answer as soon as it lands so an interrupted run can resume
+            append_cache_entries(cache_file, [{
+                "question": question,
+                "personality": personality,
+                "answer": answer,
+                "index_version": index_version,
+            }])
+            completed += 1
+            if completed % 10 == 0 or completed == len(jobs):
+                print(json.dumps({"status": "progress", "completed": completed, "remaining": len(jobs) - completed - failed,
+                                  "elapsed": round(time.time() - start_time, 1)}))
+
+    print(json.dumps({"status": "ok", "generated": completed, "failed": failed, "cache_file": cache_file}))
+
+
+if __name__ == "__main__":
+    main()
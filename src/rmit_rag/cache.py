@@ -3,7 +3,8 @@
 from __future__ import annotations
 import hashlib
 import json
-from typing import Dict, Optional
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
 from functools import lru_cache
 import logging
 
@@ -15,36 +16,48 @@ def _cached_response(query_hash: str) -> Optional[str]:
 
 # Cache storage
 _response_cache: Dict[str, str] = {}
+# Answers bulk-loaded from an offline pre-generation run; never evicted
+_pregenerated: Dict[str, str] = {}
 _cache_stats = {"hits": 0, "misses": 0}
 
-def get_cached_response(question: str) -> Optional[str]:
+def _cache_key(question: str, personality: Optional[str] = None) -> str:
+    """Hash a normalized question (and personality, when given) into a cache key."""
+    normalized = question.lower().strip()
+    if personality:
+        normalized = f"{personality}\x00{normalized}"
+    return hashlib.md5(normalized.encode()).hexdigest()
+
+def get_cached_response(question: str, personality: Optional[str] = None) -> Optional[str]:
     """Get cached response for a question if available.
     
     Args:
         question: The user's question
+        personality: Personality level the response was generated for
         
     Returns:
         Cached response if available, None otherwise
     """
     # Create a simple hash of the question for caching
-    query_hash = hashlib.md5(question.lower().strip().encode()).hexdigest()
+    query_hash = _cache_key(question, personality)
     
-    if query_hash in _response_cache:
+    cached = _response_cache.get(query_hash) or _pregenerated.get(query_hash)
+    if cached is not None:
         _cache_stats["hits"] += 1
         logging.debug(f"Cache hit for query: {question[:50]}...")
-        return _response_cache[query_hash]
+        return cached
     
     _cache_stats["misses"] += 1
     return None
 
-def cache_response(question: str, response: str) -> None:
+def cache_response(question: str, response: str, personality: Optional[str] = None) -> None:
     """Cache a response for future queries.
     
     Args:
         question: The user's question
         response: The generated response
+        personality: Personality level the response was generated for
     """
-    query_hash = hashlib.md5(question.lower().strip().encode()).hexdigest()
+    query_hash = _cache_key(question, personality)
     
     # Limit cache size (simple LRU-like behavior)
     if len(_response_cache) >= 100:
@@ -55,10 +68,74 @@ def cache_response(question: str, response: str) -> None:
     _response_cache[query_hash] = response
     logging.debug(f"Cached response for query: {question[:50]}...")
 
+def read_cache_file(path: str | Path, index_version: Optional[str] = None) -> List[dict]:
+    """Read pre-generated entries from a JSON-lines cache file.
+    
+    Args:
+        path: Cache file written by `append_cache_entries`
+        index_version: If given, only entries built against this index version are returned
+        
+    Returns:
+        List of entries with `question`, `personality`, `answer` and `index_version` keys
+    """
+    path = Path(path)
+    if not path.exists():
+        return []
+    entries: List[dict] = []
+    with path.open("r", encoding="utf-8") as fh:
+        for line in fh:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # A partially written last line from an interrupted run
+                continue
+            if index_version is not None and entry.get("index_version") != index_version:
+                continue
+            entries.append(entry)
+    return entries
+
+def append_cache_entries(path: str | Path, entries: Iterable[dict]) -> None:
+    """Append pre-generated entries to a JSON-lines cache file and flush them to disk."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("a", encoding="utf-8") as fh:
+        for entry in entries:
+            fh.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        fh.flush()
+
+def load_pregenerated(path: str | Path, index_version: str, replace: bool = False) -> int:
+    """Bulk-load pre-generated answers for `index_version` into the response cache.
+    
+    Args:
+        path: Cache file produced by `scripts/pregenerate.py`
+        index_version: Version of the index currently being served
+        replace: Swap out all previously cached answers (used when the index changes)
+        
+    Returns:
+        Number of answers loaded
+    """
+    global _pregenerated
+    entries = read_cache_file(path, index_version)
+    loaded = {} if replace else dict(_pregenerated)
+    for entry in entries:
+        loaded[_cache_key(entry["question"], entry.get("personality"))] = entry["answer"]
+    # Rebind in one step so concurrent lookups never see a half-loaded table
+    _pregenerated = loaded
+    if replace:
+        # Live answers were generated from the previous index
+        _response_cache.clear()
+    if entries:
+        logging.info(f"Loaded {len(entries)} pre-generated responses for index {index_version[:12]}")
+    return len(entries)
+
 def clear_cache() -> None:
     """Clear all cached responses."""
     global _response_cache, _cache_stats
     _response_cache.clear()
+    _pregenerated.clear()
     _cache_stats = {"hits": 0, "misses": 0}
     logging.info("Response cache cleared")
 
@@ -71,5 +148,6 @@ def get_cache_stats() -> Dict[str, int]:
     return {
         **_cache_stats,
         "size": len(_response_cache),
+        "pregenerated": len(_pregenerated),
         "hit_rate": _cache_stats["hits"] / max(1, _cache_stats["hits"] + _cache_stats["misses"])
     }
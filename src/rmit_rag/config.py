@@ -16,6 +16,51 @@ class Settings:
     max_response_length: int = int(os.getenv("MAX_RESPONSE_LENGTH", "150"))  # Limit response length for speed
     context_window: int = int(os.getenv("CONTEXT_WINDOW", "256"))  # Limit context window for speed
     batch_size: int = int(os.getenv("BATCH_SIZE", "64"))  # Larger batch size for embedding efficiency
+
+    # Embedding model and optional dimensionality reduction applied at index time:
+    # 'none', 'pca' (fitted on the corpus by build_index.py) or 'truncate' (Matryoshka models only)
+    embed_model: str = os.getenv("EMBED_MODEL", "all-MiniLM-L6-v2")
+    embed_reduction: str = os.getenv("EMBED_REDUCTION") or "none"
+    embed_dim: int = int(os.getenv("EMBED_DIM") or "128")
+    embed_pca_sample: int = int(os.getenv("EMBED_PCA_SAMPLE", "20000"))  # documents used to fit PCA
+
+    # Query micro-batching in the web server: coalesce concurrent encodes for up to EMBED_MAX_WAIT_MS
+    embed_microbatch: bool = os.getenv("EMBED_MICROBATCH", "1").lower() in {"1", "true", "yes", "on"}
+    embed_max_batch: int = int(os.getenv("EMBED_MAX_BATCH", os.getenv("BATCH_SIZE", "64")))
+    embed_max_wait_ms: float = float(os.getenv("EMBED_MAX_WAIT_MS", "2"))
+
+    # Fast path: return the curated CSV answer when the nearest stored question is this similar (cosine, 0-1).
+    # Set above 1.0 to always go through the LLM.
+    fast_path_threshold: float = float(os.getenv("FAST_PATH_THRESHOLD", "0.92"))
+
+    # Multi-turn sessions kept server-side (LRU-bounded, dropped after being idle)
+    session_max: int = int(os.getenv("SESSION_MAX", "1000"))
+    session_idle_seconds: float = float(os.getenv("SESSION_IDLE_SECONDS", "1800"))
+    session_max_turns: int = int(os.getenv("SESSION_MAX_TURNS", "4"))  # upper bound; history is also trimmed to fit
+    # num_ctx for session turns: the retained history, the new turn's documents and the reply must fit in it
+    session_context_window: int = int(
+        os.getenv("SESSION_CONTEXT_WINDOW") or max(2048, int(os.getenv("CONTEXT_WINDOW", "256")))
+    )
+
+    # LLM admission control: concurrent generations, waiting requests, max queue wait and request timeout (seconds)
+    llm_max_concurrency: int = int(os.getenv("LLM_MAX_CONCURRENCY", "2"))
+    llm_max_queue: int = int(os.getenv("LLM_MAX_QUEUE", "16"))
+    llm_queue_timeout: float = float(os.getenv("LLM_QUEUE_TIMEOUT", "10"))
+    llm_timeout: float = float(os.getenv("LLM_TIMEOUT", "60"))
+    # Per-request generation deadline (seconds, 0 = wait for the LLM); past it an extractive answer is returned
+    generation_deadline: float = float(os.getenv("GENERATION_DEADLINE", "20"))
+    cache_late_answers: bool = os.getenv("CACHE_LATE_ANSWERS", "1").lower() in {"1", "true", "yes", "on"}
+
+    # Per-request profiling (X-Profile header in the API, PROFILE in scripts/ask.py); off unless enabled
+    profile_enabled: bool = os.getenv("PROFILE_ENABLED", "0").lower() in {"1", "true", "yes", "on"}
+    profile_token: str = os.getenv("PROFILE_TOKEN", "")  # required: requests must send it as X-Profile-Token
+    profile_dir: str = os.getenv("PROFILE_DIR", "profiles")
+    profile_keep: int = int(os.getenv("PROFILE_KEEP", "20"))  # newest artifacts kept in PROFILE_DIR by the API
+
+    # Pre-generated answers (JSON lines) written by scripts/pregenerate.py and loaded by the API
+    response_cache_file: str = os.getenv(
+        "RESPONSE_CACHE_FILE", os.path.join(os.getenv("CHROMA_DIR", "chroma"), "response_cache.jsonl")
+    )
     
     # Chroma backend implementation: 'duckdb' (default) or 'sqlite'.
     # This is read by Chroma itself; we expose it here for visibility.
@@ -1,6 +1,11 @@
 from __future__ import annotations
 from pathlib import Path
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+import pyarrow.ipc as pa_ipc
+import pyarrow.parquet as pq
 
 
 # --- Q&A ingestion helpers ---
@@ -61,5 +66,122 @@ def qa_dataframe_to_documents(
         metas.append({
             "source": str(row.get("source", "qa")),
             "question": q,
+            "answer": a,
         })
     return docs, metas
+
+
+# --- Columnar (Arrow) ingestion helpers ---
+CSV_EXTENSIONS = {".csv"}
+PARQUET_EXTENSIONS = {".parquet", ".pq"}
+ARROW_EXTENSIONS = {".arrow", ".feather", ".ipc"}
+EXCEL_EXTENSIONS = {".xlsx", ".xlsm"}
+QA_EXTENSIONS = CSV_EXTENSIONS | PARQUET_EXTENSIONS | ARROW_EXTENSIONS | EXCEL_EXTENSIONS
+
+
+def _read_arrow_ipc(path: Path, columns: list[str]) -> pa.Table:
+    # Feather v2 / Arrow IPC file format first, then the streaming format
+    try:
+        with pa.memory_map(str(path), "r") as source:
+            table = pa_ipc.open_file(source).read_all()
+    except pa.ArrowInvalid:
+        with pa.memory_map(str(path), "r") as source:
+            table = pa_ipc.open_stream(source).read_all()
+    missing = set(columns) - set(table.column_names)
+    return table if missing else table.select(columns)
+
+
+def load_qa_table(file_path: str | Path,
+                  question_col: str = "question",
+                  answer_col: str = "answer",
+                  source_label: str = "qa",
+                  sheet_name: str | None = None) -> pa.Table:
+    """Load a Q&A file into an Arrow table, picking the reader from the extension.
+
+    Parameters:
+    - file_path: .csv, .parquet/.pq, .arrow/.feather/.ipc or .xlsx/.xlsm file
+    - question_col/answer_col: names of the question and answer columns
+    - source_label: sector/source label to attach to each row (e.g., "travel_pass")
+    - sheet_name: Excel sheet to read (default: `settings.sheet_name`)
+
+    Returns:
+    - An Arrow table with just the question, answer and `source` columns
+    """
+    path = Path(file_path)
+    suffix = path.suffix.lower()
+    columns = [question_col, answer_col]
+    if suffix in CSV_EXTENSIONS:
+        # Multi-threaded parser; only the Q&A columns are materialized
+        convert = pa_csv.ConvertOptions(
+            include_columns=columns,
+            include_missing_columns=False,
+            column_types={question_col: pa.string(), answer_col: pa.string()},
+        )
+        try:
+            # Quoted answers may span lines; without this, parsing breaks once a file spans several blocks
+            table = pa_csv.read_csv(
+                path,
+                parse_options=pa_csv.ParseOptions(newlines_in_values=True),
+                convert_options=convert,
+            )
+        except pa.ArrowKeyError:
+            # Raised for absent include_columns; report it like the other formats
+            with pa_csv.open_csv(path) as reader:
+                present = set(reader.schema.names)
+            raise ValueError(f"Q&A file missing required columns: {set(columns) - present}") from None
+    elif suffix in PARQUET_EXTENSIONS:
+        present = set(pq.read_schema(path).names)
+        table = pq.read_table(path, columns=[c for c in columns if c in present])
+    elif suffix in ARROW_EXTENSIONS:
+        table = _read_arrow_ipc(path, columns)
+    elif suffix in EXCEL_EXTENSIONS:
+        from .config import settings
+        df = pd.read_excel(path, sheet_name=sheet_name or settings.sheet_name, engine="openpyxl", dtype=str)
+        table = pa.Table.from_pandas(df[[c for c in columns if c in df.columns]], preserve_index=False)
+    else:
+        raise ValueError(f"Unsupported Q&A file type: {path.suffix} (expected one of {sorted(QA_EXTENSIONS)})")
+
+    if question_col not in table.column_names or answer_col not in table.column_names:
+        missing = {question_col, answer_col} - set(table.column_names)
+        raise ValueError(f"Q&A file missing required columns: {missing}")
+    table = table.select(columns)
+    return table.append_column("source", pa.array([source_label] * table.num_rows, pa.string()))
+
+
+def qa_table_to_documents(
+    table: pa.Table,
+    *,
+    question_col: str = "question",
+    answer_col: str = "answer",
+    mode: str = "concat",
+) -> tuple[list[str], list[dict]]:
+    """Columnar counterpart of `qa_dataframe_to_documents` for tables from `load_qa_table`.
+
+    Builds the document strings with Arrow compute kernels instead of a
+    per-row Python loop; the output is the same (documents, metadatas) pair.
+    Rows with a missing or blank question or answer are skipped.
+    """
+    questions = pc.cast(table[question_col], pa.string())
+    answers = pc.cast(table[answer_col], pa.string())
+    keep = pc.and_(
+        pc.greater(pc.utf8_length(pc.utf8_trim_whitespace(questions)), 0),
+        pc.greater(pc.utf8_length(pc.utf8_trim_whitespace(answers)), 0),
+    )
+    # Nulls compare as null; treat them as blank
+    keep = pc.fill_null(keep, False)
+    table = table.filter(keep)
+    questions = questions.filter(keep)
+    answers = answers.filter(keep)
+    if mode == "answer":
+        docs = answers
+    else:
+        docs = pc.binary_join_element_wise(pc.binary_join_element_wise("Q: ", questions, ""), answers, "\nA: ")
+    if "source" in table.column_names:
+        sources = pc.fill_null(pc.cast(table["source"], pa.string()), "qa").to_pylist()
+    else:
+        sources = ["qa"] * table.num_rows
+    metas = [
+        {"source": source, "question": q, "answer": a}
+        for source, q, a in zip(sources, questions.to_pylist(), answers.to_pylist())
+    ]
+    return docs.to_pylist(), metas
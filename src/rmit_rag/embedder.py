@@ -4,37 +4,48 @@ from sentence_transformers import SentenceTransformer
 import torch
 import logging
 import functools
+import os
+import queue
 import threading
+import time
+from .profiling import running_inline
 
 # Global model cache to avoid reloading
 _model_cache = {}
 _model_lock = threading.Lock()
 
+def select_device() -> str:
+    """Device the embedding model loads on: Apple Silicon (MPS) or CUDA when available, else CPU."""
+    if torch.backends.mps.is_available():
+        return "mps"
+    if torch.cuda.is_available():
+        return "cuda"
+    return "cpu"
+
+
 class Embedder:
-    def __init__(self, model_name: str = "all-MiniLM-L6-v2", batch_size: int = None) -> None:
+    def __init__(self, model_name: str = "all-MiniLM-L6-v2", batch_size: int = None, projection=None) -> None:
         """
         Initialize the Embedder with a SentenceTransformer model.
         
         Args:
             model_name (str): Name of the SentenceTransformer model. Defaults to 'all-MiniLM-L6-v2'.
             batch_size (int): Batch size for encoding. Defaults to 32.
+            projection: Optional `rmit_rag.projection` reducer applied to every output (PCA or truncation).
         Raises:
             ValueError: If model_name is invalid or unsupported.
         """
         from .config import settings
         self.model_name = model_name
         self.batch_size = batch_size or settings.batch_size
+        self.projection = projection
         
         # Use cached model if available
         with _model_lock:
             if model_name not in _model_cache:
                 try:
                     # Prefer Apple Silicon (MPS) or CUDA when available for faster encoding
-                    device = "cpu"
-                    if torch.backends.mps.is_available():
-                        device = "mps"
-                    elif torch.cuda.is_available():
-                        device = "cuda"
+                    device = select_device()
                     
                     # Load with optimizations
                     _model_cache[model_name] = SentenceTransformer(
@@ -83,6 +94,8 @@ class Embedder:
                 normalize_embeddings=True,  # Enable normalization for better similarity search
                 device=None  # Use model's device
             ).tolist()
+            if self.projection is not None:
+                embeddings = self.projection.transform(embeddings)
             
             # Only log for larger batches to reduce logging overhead
             if len(valid_texts) > 10:
@@ -91,3 +104,118 @@ class Embedder:
         except Exception as e:
             logging.error(f"Encoding failed: {str(e)}")
             raise
+
+
+class _PendingEncode:
+    __slots__ = ("texts", "done", "result", "error")
+
+    def __init__(self, texts: List[str]) -> None:
+        self.texts = texts
+        self.done = threading.Event()
+        self.result: List[List[float]] | None = None
+        self.error: BaseException | None = None
+
+
+class BatchingEmbedder:
+    def __init__(self, embedder: Embedder, max_batch_size: int = None, max_wait_ms: float = None) -> None:
+        """
+        Coalesce concurrent `encode` calls into shared forward passes.
+
+        Requests arriving within `max_wait_ms` of each other are encoded as
+        one batch of up to `max_batch_size` texts, then each caller gets back
+        its own vectors.
+
+        Args:
+            embedder (Embedder): The embedder doing the actual encoding.
+            max_batch_size (int): Texts per forward pass. Defaults to EMBED_MAX_BATCH.
+            max_wait_ms (float): How long to hold a batch open for more requests. Defaults to EMBED_MAX_WAIT_MS.
+        """
+        from .config import settings
+        self.embedder = embedder
+        self.model_name = embedder.model_name
+        self.batch_size = embedder.batch_size
+        self.max_batch_size = max_batch_size or settings.embed_max_batch
+        self.max_wait = (settings.embed_max_wait_ms if max_wait_ms is None else max_wait_ms) / 1000.0
+        self._lock = threading.Lock()
+        self._queue: queue.Queue | None = None
+        self._worker: threading.Thread | None = None
+        self._pid: int | None = None
+        self._stats = {"batches": 0, "requests": 0, "texts": 0}
+
+    def _ensure_worker(self) -> queue.Queue:
+        # Threads don't survive fork, so a forked worker process starts its own
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive() or self._pid != os.getpid():
+                self._queue = queue.Queue()
+                self._pid = os.getpid()
+                self._worker = threading.Thread(target=self._run, args=(self._queue,), name="embed-batcher", daemon=True)
+                self._worker.start()
+            return self._queue
+
+    def encode(self, texts: List[str]) -> List[List[float]]:
+        """
+        Encode texts, sharing a forward pass with other concurrent callers.
+
+        Args:
+            texts (List[str]): List of texts to encode.
+        Returns:
+            List[List[float]]: List of embeddings for each valid text.
+        Raises:
+            ValueError: If texts is empty or contains invalid entries.
+        """
+        if not texts:
+            raise ValueError("Input texts list cannot be empty")
+
+        # Same filtering as Embedder.encode so results line up per request
+        valid_texts = [text for text in texts if isinstance(text, str) and text.strip()]
+        if not valid_texts:
+            raise ValueError("No valid texts provided for encoding")
+
+        # Bulk requests already fill a batch on their own; a profiled request encodes on its own thread
+        if len(valid_texts) >= self.max_batch_size or running_inline():
+            return self.embedder.encode(valid_texts)
+
+        pending = _PendingEncode(valid_texts)
+        self._ensure_worker().put(pending)
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def _run(self, requests: queue.Queue) -> None:
+        while True:
+            batch = [requests.get()]
+            size = len(batch[0].texts)
+            deadline = time.monotonic() + self.max_wait
+            while size < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = requests.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batch.append(item)
+                size += len(item.texts)
+
+            try:
+                vectors = self.embedder.encode([text for item in batch for text in item.texts])
+                offset = 0
+                for item in batch:
+                    item.result = vectors[offset:offset + len(item.texts)]
+                    offset += len(item.texts)
+            except BaseException as e:
+                for item in batch:
+                    item.error = e
+            finally:
+                self._stats["batches"] += 1
+                self._stats["requests"] += len(batch)
+                self._stats["texts"] += size
+                for item in batch:
+                    item.done.set()
+
+    def stats(self) -> dict:
+        """Batch counts and the average number of texts per forward pass."""
+        stats = dict(self._stats)
+        stats["avg_batch_size"] = round(stats["texts"] / max(1, stats["batches"]), 2)
+        return stats
@@ -32,3 +32,7 @@ class VectorStoreProtocol(Protocol):
         ...
 
 
+@runtime_checkable
+class LLMProtocol(Protocol):
+    def chat(self, messages: Sequence[dict], options: dict | None = None) -> str:
+        ...
@@ -0,0 +1,44 @@
+from __future__ import annotations
+import time
+from typing import Sequence
+import ollama
+from .config import settings
+
+
+class OllamaLLM:
+    def __init__(self, model: str | None = None, timeout: float | None = None) -> None:
+        """Chat model served by a local Ollama instance.
+
+        Defaults to the configured `OLLAMA_MODEL` and `LLM_TIMEOUT`.
+        """
+        self.model = model or settings.ollama_model
+        self._client = ollama.Client(timeout=timeout if timeout is not None else settings.llm_timeout)
+
+    def chat(self, messages: Sequence[dict], options: dict | None = None) -> str:
+        """Send `messages` and return the assistant reply text."""
+        response = self._client.chat(model=self.model, messages=list(messages), options=options or {})
+        return response["message"]["content"]
+
+
+class DeterministicLLM:
+    def __init__(self, reply: str | None = None, delay: float = 0.0) -> None:
+        """Offline stand-in for tests and local runs without Ollama.
+
+        Returns `reply` if given, otherwise the first line of the last user
+        message's context, after sleeping `delay` seconds (useful for
+        exercising generation deadlines).
+        """
+        self.reply = reply
+        self.delay = delay
+        self.calls = 0
+
+    def chat(self, messages: Sequence[dict], options: dict | None = None) -> str:
+        """Return a reply that depends only on `messages`."""
+        self.calls += 1
+        if self.delay:
+            time.sleep(self.delay)
+        if self.reply is not None:
+            return self.reply
+        prompt = next((m["content"] for m in reversed(messages) if m.get("role") == "user"), "")
+        _, _, context = prompt.partition("Context: ")
+        return context.split("\n", 1)[0].strip() or prompt.strip()
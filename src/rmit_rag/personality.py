@@ -96,3 +96,21 @@ def get_available_personalities() -> Dict[str, str]:
         "casual": "Relaxed, informal student-to-student chat style",
         "enthusiastic": "High energy, motivational ambassador style with lots of excitement"
     }
+
+
+def get_fast_path_template(personality_level: str) -> str:
+    """Get the template used to wrap a curated answer returned without the LLM.
+
+    Args:
+        personality_level: One of 'friendly', 'professional', 'casual', 'enthusiastic'
+
+    Returns:
+        Format string with an `{answer}` placeholder
+    """
+    templates = {
+        "friendly": "{answer} 😊",
+        "professional": "{answer}",
+        "casual": "Here's the deal: {answer}",
+        "enthusiastic": "Great question! 🎉 {answer}",
+    }
+    return templates.get(personality_level, templates["friendly"])
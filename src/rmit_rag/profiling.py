@@ -0,0 +1,210 @@
+"""Opt-in profiling of a single query: stack samples or cProfile, plus tracemalloc allocations."""
+
+from __future__ import annotations
+import cProfile
+import io
+import json
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+from pathlib import Path
+from typing import Any, Callable, Dict, Tuple
+
+PROFILE_MODES = ("sampling", "deterministic")
+
+# tracemalloc and the sampler see the whole process, so one profiled request at a time
+_profile_lock = threading.Lock()
+
+# Helper threads that do work on behalf of a request (see rag.py, embedder.py, vector_store.py)
+WORKER_THREAD_PREFIXES = ("generate", "embed-batcher", "shard-query")
+
+# Innermost frames of a helper thread that is parked waiting for work
+_IDLE_FRAMES = {
+    ("threading", "wait"),
+    ("queue", "get"),
+    ("threading", "_wait_for_tstate_lock"),
+    ("concurrent.futures.thread", "_worker"),  # blocked in the C-level work queue get
+}
+
+
+# Set on the thread running a deterministic profile; helpers then do their work inline on it
+_inline = threading.local()
+
+
+def running_inline() -> bool:
+    """Whether this thread is under a deterministic profile.
+
+    cProfile only instruments the calling thread, so the embedding batcher,
+    the generation pool and the shard fan-out check this and run their work
+    on the caller instead of handing it to their own threads.
+    """
+    return getattr(_inline, "active", False)
+
+
+class ProfileBusyError(RuntimeError):
+    """Another request is already being profiled in this process."""
+
+
+def _collapse(frame) -> str:
+    """Render a frame's stack root-first as `module:function;...` (flamegraph collapsed format)."""
+    parts = []
+    while frame is not None:
+        code = frame.f_code
+        module = frame.f_globals.get("__name__", Path(code.co_filename).stem)
+        parts.append(f"{module}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(parts))
+
+
+def _is_idle(frame) -> bool:
+    """Whether a helper thread is parked (e.g. a pool worker waiting on its queue)."""
+    module = frame.f_globals.get("__name__", "")
+    return (module, frame.f_code.co_name) in _IDLE_FRAMES
+
+
+class _StackSampler:
+    def __init__(self, interval: float, target: int) -> None:
+        """Sample the `target` thread plus busy helper threads (WORKER_THREAD_PREFIXES)."""
+        self.interval = interval
+        self.target = target
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            # Embedding, retrieval and generation may run off the request thread; other request
+            # threads, pollers and idle pool workers would only add noise
+            for ident, frame in sys._current_frames().items():
+                name = names.get(ident, str(ident))
+                if ident != self.target and (not name.startswith(WORKER_THREAD_PREFIXES) or _is_idle(frame)):
+                    continue
+                self.stacks[f"{name};{_collapse(frame)}"] += 1
+            self.samples += 1
+
+    def __enter__(self) -> "_StackSampler":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        self._thread.join()
+
+
+def _display_path(filename: str) -> str:
+    """Path relative to its import root (e.g. "rmit_rag/rag.py"), so artifacts don't reveal the server layout."""
+    path = Path(filename)
+    for root in sorted((Path(p) for p in sys.path if p), key=lambda p: len(p.parts), reverse=True):
+        try:
+            return str(path.relative_to(root))
+        except ValueError:
+            continue
+    return path.name
+
+
+def _top_allocations(snapshot: tracemalloc.Snapshot, limit: int) -> list:
+    return [
+        {
+            "location": f"{_display_path(stat.traceback[0].filename)}:{stat.traceback[0].lineno}",
+            "size_kb": round(stat.size / 1024, 1),
+            "count": stat.count,
+        }
+        for stat in snapshot.statistics("lineno")[:limit]
+    ]
+
+
+def profile_call(
+    fn: Callable[..., Any],
+    *args: Any,
+    mode: str = "sampling",
+    interval: float = 0.005,
+    top_allocations: int = 15,
+    **kwargs: Any,
+) -> Tuple[Any, Dict[str, Any]]:
+    """Run `fn(*args, **kwargs)` under a profiler and return its result with a profile artifact.
+
+    Args:
+        mode: "sampling" (low overhead, request thread plus busy helper threads) or
+            "deterministic" (cProfile; embedding, retrieval and generation run inline on the calling thread)
+        interval: Seconds between stack samples in sampling mode
+        top_allocations: Number of allocation sites to report
+
+    Returns:
+        (result, artifact) where artifact holds collapsed stacks or cProfile stats,
+        the top allocation sites and timing
+
+    Raises:
+        ProfileBusyError: Another call is already being profiled
+        ValueError: Unknown `mode`
+    """
+    if mode not in PROFILE_MODES:
+        raise ValueError(f"Unknown profile mode: {mode} (expected one of {PROFILE_MODES})")
+    if not _profile_lock.acquire(blocking=False):
+        raise ProfileBusyError("A profiled request is already running")
+    started_tracing = not tracemalloc.is_tracing()
+    try:
+        if started_tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        artifact: Dict[str, Any] = {"id": uuid.uuid4().hex[:12], "mode": mode}
+        start = time.perf_counter()
+        if mode == "sampling":
+            with _StackSampler(interval, threading.get_ident()) as sampler:
+                result = fn(*args, **kwargs)
+            artifact["samples"] = sampler.samples
+            artifact["interval_ms"] = interval * 1000
+            artifact["collapsed"] = "\n".join(f"{stack} {count}" for stack, count in sampler.stacks.most_common())
+        else:
+            profiler = cProfile.Profile()
+            _inline.active = True
+            try:
+                result = profiler.runcall(fn, *args, **kwargs)
+            finally:
+                _inline.active = False
+            out = io.StringIO()
+            pstats.Stats(profiler, stream=out).strip_dirs().sort_stats("cumulative").print_stats(40)
+            artifact["stats"] = out.getvalue()
+        artifact["wall_time_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        _, peak = tracemalloc.get_traced_memory()
+        artifact["peak_kb"] = round(peak / 1024, 1)
+        artifact["top_allocations"] = _top_allocations(tracemalloc.take_snapshot(), top_allocations)
+        return result, artifact
+    finally:
+        if started_tracing:
+            tracemalloc.stop()
+        _profile_lock.release()
+
+
+def save_profile(artifact: Dict[str, Any], directory: str | Path, keep: int | None = None) -> Path:
+    """Write the artifact as JSON (plus a `.collapsed` file for flamegraph tools); returns the JSON path.
+
+    With `keep`, only the newest `keep` artifacts in `directory` are retained.
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    stem = f"{time.strftime('%Y%m%dT%H%M%S')}-{artifact['id']}"
+    path = directory / f"{stem}.json"
+    path.write_text(json.dumps(artifact, indent=2), encoding="utf-8")
+    if artifact.get("collapsed"):
+        (directory / f"{stem}.collapsed").write_text(artifact["collapsed"] + "\n", encoding="utf-8")
+    if keep is not None:
+        for old in sorted(directory.glob("*.json"), key=lambda p: p.stat().st_mtime)[:-max(1, keep)]:
+            old.unlink(missing_ok=True)
+            old.with_suffix(".collapsed").unlink(missing_ok=True)
+    return path
+
+
+def summarize_profile(artifact: Dict[str, Any], top_stacks: int = 10) -> Dict[str, Any]:
+    """Compact view of an artifact suitable for an API response."""
+    summary = {key: artifact[key] for key in ("id", "mode", "wall_time_ms", "peak_kb", "top_allocations") if key in artifact}
+    if artifact.get("collapsed"):
+        summary["top_stacks"] = artifact["collapsed"].splitlines()[:top_stacks]
+    if artifact.get("stats"):
+        summary["stats"] = artifact["stats"]
+    return summary
@@ -0,0 +1,105 @@
+"""Embedding dimensionality reduction: PCA fitted on the corpus, or Matryoshka truncation."""
+
+from __future__ import annotations
+from pathlib import Path
+from typing import Sequence
+import numpy as np
+
+REDUCTION_MODES = ("none", "pca", "truncate")
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class PCAProjection:
+    kind = "pca"
+
+    def __init__(self, mean: np.ndarray, components: np.ndarray) -> None:
+        """Linear projection onto the top principal components of the corpus.
+
+        `components` has shape (dim, input_dim); outputs are re-normalized so
+        cosine/L2 search behaves as it does on the full embeddings.
+        """
+        self.mean = np.asarray(mean, dtype=np.float32)
+        self.components = np.asarray(components, dtype=np.float32)
+
+    @property
+    def dim(self) -> int:
+        return int(self.components.shape[0])
+
+    @property
+    def input_dim(self) -> int:
+        return int(self.components.shape[1])
+
+    @classmethod
+    def fit(cls, embeddings: Sequence[Sequence[float]], dim: int) -> "PCAProjection":
+        """Fit on corpus embeddings, keeping `dim` components (capped by the sample size)."""
+        x = np.asarray(embeddings, dtype=np.float32)
+        mean = x.mean(axis=0)
+        # Rows of vt are the principal directions, strongest first
+        _, _, vt = np.linalg.svd(x - mean, full_matrices=False)
+        return cls(mean, vt[:min(dim, vt.shape[0])])
+
+    def transform(self, embeddings: Sequence[Sequence[float]]) -> list[list[float]]:
+        x = np.asarray(embeddings, dtype=np.float32)
+        return _normalize((x - self.mean) @ self.components.T).tolist()
+
+    def save(self, path: str | Path) -> None:
+        np.savez(path, kind=self.kind, mean=self.mean, components=self.components)
+
+
+class TruncateProjection:
+    kind = "truncate"
+
+    def __init__(self, dim: int, input_dim: int) -> None:
+        """Keep the first `dim` coordinates and re-normalize.
+
+        Only meaningful for Matryoshka-trained models, whose leading
+        dimensions carry most of the signal.
+        """
+        self._dim = dim
+        self._input_dim = input_dim
+
+    @property
+    def dim(self) -> int:
+        return self._dim
+
+    @property
+    def input_dim(self) -> int:
+        return self._input_dim
+
+    def transform(self, embeddings: Sequence[Sequence[float]]) -> list[list[float]]:
+        x = np.asarray(embeddings, dtype=np.float32)
+        return _normalize(x[:, :self._dim]).tolist()
+
+    def save(self, path: str | Path) -> None:
+        np.savez(path, kind=self.kind, dim=self._dim, input_dim=self._input_dim)
+
+
+def projection_path(persist_directory: str | Path, collection_name: str) -> Path:
+    """Where a collection's projection is stored, next to its Chroma files."""
+    return Path(persist_directory) / f"{collection_name}.projection.npz"
+
+
+def load_projection(path: str | Path) -> PCAProjection | TruncateProjection | None:
+    """Load a saved projection, or None if the index was built at full dimension."""
+    path = Path(path)
+    if not path.exists():
+        return None
+    with np.load(path) as data:
+        kind = str(data["kind"])
+        if kind == PCAProjection.kind:
+            return PCAProjection(data["mean"], data["components"])
+        if kind == TruncateProjection.kind:
+            return TruncateProjection(int(data["dim"]), int(data["input_dim"]))
+    raise ValueError(f"Unknown projection kind in {path}: {kind}")
+
+
+def project_queries(projection, query_embeddings: Sequence[Sequence[float]]) -> list:
+    """Project full-size query embeddings; embeddings already at the reduced size pass through."""
+    query_embeddings = list(query_embeddings)
+    if projection is None or not query_embeddings or len(query_embeddings[0]) != projection.input_dim:
+        return query_embeddings
+    return projection.transform(query_embeddings)
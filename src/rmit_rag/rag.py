@@ -1,32 +1,77 @@
 from __future__ import annotations
-from typing import Sequence
-import ollama
+from typing import Callable, Sequence
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+import logging
+import time
 from .embedder import Embedder
-from .vector_store import VectorStore
+from .vector_store import ShardedVectorStore, VectorStore
+from .llm import OllamaLLM
 from .config import settings
-from .interfaces import EmbedderProtocol, VectorStoreProtocol
-from .personality import get_personality_config
+from .interfaces import EmbedderProtocol, VectorStoreProtocol, LLMProtocol
+from .personality import get_personality_config, get_fast_path_template
 from .cache import get_cached_response, cache_response
+from .sessions import Session, SessionStore, condense_question, estimate_tokens, is_followup
+from .profiling import running_inline
+from .scheduler import GenerationScheduler, QueueTimeoutError, PRIORITY_HIGH, PRIORITY_NORMAL
 
 
 class RAGPipeline:
     def __init__(
         self,
         collection_name: str,
-        embed_model: str = "all-MiniLM-L6-v2",
+        embed_model: str | None = None,
         *,
         embedder: EmbedderProtocol | None = None,
         store: VectorStoreProtocol | None = None,
+        llm: LLMProtocol | None = None,
     ) -> None:
         """Construct a RAG pipeline with injectable components.
 
-        If `embedder`/`store` are omitted, sensible defaults are created
-        using the configured embed model and Chroma persist directory.
+        If `embedder`/`store`/`llm` are omitted, sensible defaults are created
+        using the configured embed model, Chroma persist directory and Ollama model.
         """
-        self.embedder: EmbedderProtocol = embedder or Embedder(embed_model)
+        self.embedder: EmbedderProtocol = embedder or Embedder(embed_model or settings.embed_model)
         self.store: VectorStoreProtocol = store or VectorStore(
             collection_name, persist_directory=settings.chroma_dir
         )
+        self.sessions = SessionStore(
+            max_sessions=settings.session_max,
+            idle_seconds=settings.session_idle_seconds,
+            max_turns=settings.session_max_turns,
+        )
+        # Bounded concurrency and queueing in front of the LLM
+        self.scheduler = GenerationScheduler(
+            max_concurrency=settings.llm_max_concurrency,
+            max_queue=settings.llm_max_queue,
+            queue_timeout=settings.llm_queue_timeout,
+        )
+        self.llm: LLMProtocol = llm or OllamaLLM()
+        # Runs admitted generations so a request can stop waiting at its deadline while the call
+        # finishes; work is only submitted while holding a scheduler slot, so it never queues here
+        self._generation_pool = ThreadPoolExecutor(
+            max_workers=self.scheduler.max_concurrency,
+            thread_name_prefix="generate",
+        )
+        # Content version of `store` (snapshot checksum) and its manifest, when known
+        self.index_version: str | None = None
+        self.manifest: dict | None = None
+
+    def swap_store(
+        self,
+        store: VectorStoreProtocol,
+        index_version: str | None = None,
+        manifest: dict | None = None,
+    ) -> VectorStoreProtocol:
+        """Atomically make `store` the one used by subsequent queries.
+
+        Queries already running keep the store they started with; the
+        previous store is returned so the caller can release it.
+        """
+        previous = self.store
+        self.store = store
+        self.index_version = index_version
+        self.manifest = manifest
+        return previous
 
     def index(self, documents: Sequence[str], metadatas: Sequence[dict] | None = None) -> None:
         """Embed `documents` and write them to the vector store.
@@ -48,46 +93,320 @@ class RAGPipeline:
 
         Builds a strict prompt to constrain answers to retrieved context.
         """
+        return self.query_detailed(question, n_results=n_results)["answer"]
+
+    def query_detailed(
+        self,
+        question: str,
+        n_results: int = 3,
+        *,
+        sources: Sequence[str] | None = None,
+        session: Session | None = None,
+    ) -> dict:
+        """Answer `question` and report how the answer was produced.
+
+        `sources` restricts retrieval to those source labels on a
+        `ShardedVectorStore` and is ignored by other stores. With a `session` (from
+        `self.sessions`), the question is answered as the next turn of
+        that conversation.
+
+        Returns a dict with `answer`, `cached`, `fast_path` and `fallback`
+        keys, plus `session_id` and `followup` for session turns.
+        """
+        if session is not None:
+            # Turns of one conversation are answered strictly in order
+            with session.lock:
+                return self._query_session(question, n_results, session, sources)
+
         # Check cache first for instant responses
-        cached_response = get_cached_response(question)
+        cached_response = get_cached_response(question, settings.personality_level)
         if cached_response:
-            return cached_response
-            
+            return {"answer": cached_response, "cached": True, "fast_path": False, "fallback": False}
+
         # Optimize: encode single query efficiently
         query_embedding = self.embedder.encode([question])
-        results = self.store.query(query_embeddings=query_embedding, n_results=n_results)
-        # Optimize: limit to top 3 documents and join efficiently
-        context = "\n".join(results["documents"][0][:3]) if results and results.get("documents") else ""
-        # Get personality configuration
-        system_prompt, user_template, temperature = get_personality_config(settings.personality_level)
-        
-        # Use custom temperature if provided, otherwise use personality default
-        final_temperature = settings.temperature if settings.temperature != 0.4 else temperature
-        
-        prompt = user_template.format(context=context, question=question)
-        
-        response = ollama.chat(
-            model=settings.ollama_model,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": prompt},
-            ],
-            options={
-                "temperature": min(final_temperature, 0.3),  # Lower temperature for faster, more deterministic generation
-                "top_p": 0.8,           # Reduce sampling space for faster generation
-                "num_predict": settings.max_response_length,  # Limit response length for faster generation
-                "num_ctx": settings.context_window,           # Limit context window for faster processing
-                "stop": ["Question:", "Context:"],  # Stop tokens for faster generation
-                "top_k": 15,           # Reduce sampling space for faster generation
-                "repeat_penalty": 1.05, # Prevent repetition for cleaner responses
-                "tfs_z": 0.9,         # Tail free sampling for faster generation
-                "seed": 42,            # Deterministic generation for consistency
-            },
+        results = retrieve(self.store, query_embedding, n_results, sources)
+
+        # Near-verbatim FAQ match: skip the LLM and return the curated answer
+        direct_answer = self._fast_path_answer(question, query_embedding[0], results)
+        if direct_answer is not None:
+            return {"answer": direct_answer, "cached": False, "fast_path": True, "fallback": False}
+
+        personality = settings.personality_level
+        messages, temperature = self._build_messages(question, build_context(results), personality)
+        response_content, fallback = self._chat_within_deadline(
+            messages,
+            temperature,
+            results,
+            on_late=lambda answer: cache_response(question, answer, personality),
         )
-        
-        response_content = response["message"]["content"]
-        
+
         # Cache the response for future queries
-        cache_response(question, response_content)
-        
-        return response_content
+        if not fallback:
+            cache_response(question, response_content, personality)
+
+        return {"answer": response_content, "cached": False, "fast_path": False, "fallback": fallback}
+
+    def _query_session(self, question: str, n_results: int, session: Session, sources: Sequence[str] | None) -> dict:
+        """Answer one turn of `session`, reusing the conversation so far.
+
+        Follow-ups are condensed into a standalone retrieval query, only
+        documents the model has not already seen are added to the prompt,
+        and the earlier messages are resent unchanged so Ollama can reuse
+        their evaluated prefix.
+        """
+        personality = settings.personality_level
+        system_prompt, user_template, temperature = get_personality_config(personality)
+        if not session.messages:
+            session.messages.append({"role": "system", "content": system_prompt})
+
+        followup = is_followup(question, session)
+        retrieval_query = condense_question(question, session)
+        query_embedding = self.embedder.encode([retrieval_query])
+        results = retrieve(self.store, query_embedding, n_results, sources)
+
+        documents = results["documents"][0][:3] if results and results.get("documents") else []
+        # Keep only the history that fits the session window next to this turn with all its
+        # documents and the reply, so Ollama never truncates it; whatever is still retained is
+        # then known to be visible to the model and need not be resent
+        full_message = user_template.format(context="\n".join(documents), question=question)
+        self.sessions.fit_history(
+            session,
+            settings.session_context_window - settings.max_response_length - estimate_tokens(full_message),
+        )
+        seen = session.seen_docs()
+        new_docs = [doc for doc in documents if doc not in seen]
+        context = "\n".join(new_docs) if new_docs else "(see the context given earlier in this conversation)"
+        user_message = {"role": "user", "content": user_template.format(context=context, question=question)}
+
+        info = {"cached": False, "fast_path": False, "fallback": False,
+                "session_id": session.session_id, "followup": followup}
+        answer = None
+        if not followup:
+            # A standalone question means the same thing with or without the history
+            answer = get_cached_response(question, personality)
+            if answer:
+                info["cached"] = True
+            else:
+                answer = self._fast_path_answer(question, query_embedding[0], results)
+                info["fast_path"] = answer is not None
+        if not answer:
+            # Follow-ups reuse the evaluated conversation prefix, so they are cheap to serve first
+            priority = PRIORITY_HIGH if followup else PRIORITY_NORMAL
+            on_late = None if followup else (lambda late: cache_response(question, late, personality))
+            answer, info["fallback"] = self._chat_within_deadline(
+                session.messages + [user_message],
+                temperature,
+                results,
+                priority=priority,
+                on_late=on_late,
+                num_ctx=settings.session_context_window,
+            )
+            if not followup and not info["fallback"]:
+                cache_response(question, answer, personality)
+
+        self.sessions.record_turn(session, question, user_message, answer, new_docs, followup=followup)
+        return {"answer": answer, **info}
+
+    def _fast_path_answer(self, question: str, query_embedding: Sequence[float], results: dict) -> str | None:
+        """Return the curated answer of the nearest stored question if it clears the threshold."""
+        if settings.fast_path_threshold > 1.0 or not results or not results.get("metadatas"):
+            return None
+        documents = results["documents"][0] if results.get("documents") else []
+        candidates = [
+            (meta, documents[i] if i < len(documents) else "")
+            for i, meta in enumerate(results["metadatas"][0])
+            if meta and meta.get("question")
+        ]
+        if not candidates:
+            return None
+
+        normalized = question.lower().strip()
+        best_meta, best_doc, best_score = None, "", -1.0
+        for meta, doc in candidates:
+            if meta["question"].lower().strip() == normalized:
+                best_meta, best_doc, best_score = meta, doc, 1.0
+                break
+        else:
+            # Compare against the stored questions themselves; documents also carry the answer text
+            question_embeddings = self.embedder.encode([meta["question"] for meta, _ in candidates])
+            for (meta, doc), emb in zip(candidates, question_embeddings):
+                # Embeddings are normalized, so the dot product is the cosine similarity
+                score = sum(a * b for a, b in zip(query_embedding, emb))
+                if score > best_score:
+                    best_meta, best_doc, best_score = meta, doc, score
+
+        if best_meta is None or best_score < settings.fast_path_threshold:
+            return None
+        answer = _stored_answer(best_meta, best_doc)
+        if not answer:
+            return None
+        logging.debug(f"Fast path hit ({best_score:.3f}) for query: {question[:50]}...")
+        return get_fast_path_template(settings.personality_level).format(answer=answer)
+
+    def generate(
+        self,
+        question: str,
+        context: str,
+        personality: str | None = None,
+        priority: int = PRIORITY_NORMAL,
+    ) -> str:
+        """Ask the chat model to answer `question` from `context`.
+
+        `personality` defaults to the configured personality level;
+        `priority` orders the request in the generation queue.
+        """
+        messages, temperature = self._build_messages(question, context, personality)
+        return self._chat(messages, temperature, priority=priority)
+
+    def _build_messages(self, question: str, context: str, personality: str | None = None) -> tuple[list[dict], float]:
+        """Build the system/user messages and default temperature for a personality."""
+        # Get personality configuration
+        system_prompt, user_template, temperature = get_personality_config(personality or settings.personality_level)
+
+        prompt = user_template.format(context=context, question=question)
+
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": prompt},
+        ], temperature
+
+    def _chat_within_deadline(
+        self,
+        messages: list[dict],
+        temperature: float,
+        results: dict,
+        *,
+        priority: int = PRIORITY_NORMAL,
+        on_late: Callable[[str], None] | None = None,
+        num_ctx: int | None = None,
+    ) -> tuple[str, bool]:
+        """Generate within `GENERATION_DEADLINE`, else fall back to an extractive answer.
+
+        When the deadline passes, `on_late` (if given and `CACHE_LATE_ANSWERS`
+        is on) receives the full answer once the model finishes. `num_ctx`
+        overrides `CONTEXT_WINDOW` for this call.
+
+        Returns:
+            (answer, fallback) where `fallback` is True for the extractive answer
+        """
+        deadline = settings.generation_deadline
+        # A deterministic profile must see the LLM call on its own thread, so it waits without a deadline
+        if deadline <= 0 or running_inline():
+            return self._chat(messages, temperature, priority=priority, num_ctx=num_ctx), False
+
+        # Admission happens on the request thread, so a full queue is rejected (429) right away
+        # and nothing reaches the pool without a slot; never wait in the queue past the deadline
+        try:
+            waited = self.scheduler.acquire(priority, min(deadline, settings.llm_queue_timeout))
+        except QueueTimeoutError:
+            logging.warning(f"No generation slot within {deadline}s deadline; returning extractive answer")
+            return extractive_answer(results), True
+
+        # The worker owns the slot from here and releases it when the model returns
+        future = self._generation_pool.submit(self._chat_in_slot, messages, temperature, num_ctx)
+        try:
+            return future.result(timeout=max(0.0, deadline - waited)), False
+        except FutureTimeoutError:
+            pass
+
+        if on_late is not None and settings.cache_late_answers:
+            def _store_late(done) -> None:
+                if not done.cancelled() and done.exception() is None:
+                    on_late(done.result())
+            future.add_done_callback(_store_late)
+        logging.warning(f"Generation exceeded {deadline}s deadline; returning extractive answer")
+        return extractive_answer(results), True
+
+    def _chat(
+        self,
+        messages: list[dict],
+        temperature: float,
+        priority: int = PRIORITY_NORMAL,
+        queue_timeout: float | None = None,
+        num_ctx: int | None = None,
+    ) -> str:
+        """Send `messages` to the chat model and return the reply text.
+
+        Waits for a slot from `self.scheduler`; raises `QueueFullError` or
+        `QueueTimeoutError` when the LLM is saturated.
+        """
+        with self.scheduler.slot(priority, queue_timeout):
+            return self.llm.chat(messages, options=_chat_options(temperature, num_ctx))
+
+    def _chat_in_slot(self, messages: list[dict], temperature: float, num_ctx: int | None = None) -> str:
+        """Like `_chat`, for a caller that already acquired a scheduler slot; releases it when done."""
+        start = time.monotonic()
+        try:
+            return self.llm.chat(messages, options=_chat_options(temperature, num_ctx))
+        finally:
+            self.scheduler.release(time.monotonic() - start)
+
+
+def _chat_options(temperature: float, num_ctx: int | None = None) -> dict:
+    """Ollama generation options for a personality's default `temperature` (and an optional `num_ctx`)."""
+    # Use custom temperature if provided, otherwise use personality default
+    final_temperature = settings.temperature if settings.temperature != 0.4 else temperature
+    return {
+        "temperature": min(final_temperature, 0.3),  # Lower temperature for faster, more deterministic generation
+        "top_p": 0.8,           # Reduce sampling space for faster generation
+        "num_predict": settings.max_response_length,  # Limit response length for faster generation
+        "num_ctx": num_ctx or settings.context_window,  # Limit context window for faster processing
+        "stop": ["Question:", "Context:"],  # Stop tokens for faster generation
+        "top_k": 15,           # Reduce sampling space for faster generation
+        "repeat_penalty": 1.05, # Prevent repetition for cleaner responses
+        "tfs_z": 0.9,         # Tail free sampling for faster generation
+        "seed": 42,            # Deterministic generation for consistency
+    }
+
+
+def retrieve(
+    store: VectorStoreProtocol,
+    query_embeddings: Sequence[Sequence[float]],
+    n_results: int,
+    sources: Sequence[str] | None = None,
+) -> dict:
+    """Query `store`, restricted to `sources` when it is sharded (other stores search everything)."""
+    if isinstance(sources, str):
+        raise TypeError("sources must be a list of source labels, not a string")
+    if sources and isinstance(store, ShardedVectorStore):
+        return store.query(query_embeddings=query_embeddings, n_results=n_results, sources=sources)
+    return store.query(query_embeddings=query_embeddings, n_results=n_results)
+
+
+def build_context(results: dict, index: int = 0) -> str:
+    """Join the retrieved documents for query `index` into a prompt context."""
+    # Optimize: limit to top 3 documents and join efficiently
+    return "\n".join(results["documents"][index][:3]) if results and results.get("documents") else ""
+
+
+def extractive_answer(results: dict, max_answers: int = 2) -> str:
+    """Answer from the curated answers of the top retrieved rows, without the LLM."""
+    if not results or not results.get("metadatas"):
+        return "Sorry, I couldn't put an answer together in time. Please try again in a moment."
+    documents = results["documents"][0] if results.get("documents") else []
+    answers: list[str] = []
+    for i, meta in enumerate(results["metadatas"][0]):
+        answer = _stored_answer(meta or {}, documents[i] if i < len(documents) else "")
+        if answer and answer not in answers:
+            answers.append(answer)
+        if len(answers) >= max_answers:
+            break
+    if not answers:
+        return "Sorry, I couldn't put an answer together in time. Please try again in a moment."
+    return "\n\n".join(answers)
+
+
+def _stored_answer(meta: dict, document: str) -> str:
+    """Recover the curated answer for a stored Q&A row.
+
+    Indexes built before answers were kept in metadata only have the
+    document text, which in "concat" mode looks like "Q: ...\nA: ...".
+    """
+    if meta.get("answer"):
+        return str(meta["answer"])
+    marker = "\na: " if "\na: " in document.lower() else None
+    if marker:
+        idx = document.lower().index(marker)
+        return document[idx + len(marker):].strip()
+    return document.strip()
@@ -0,0 +1,65 @@
+"""Process-level tuning for multi-worker serving: CPU thread budgets and index page-in."""
+
+from __future__ import annotations
+import logging
+import os
+from pathlib import Path
+
+# Thread-pool knobs read by the BLAS/OpenMP runtimes when they are first loaded
+THREAD_ENV_VARS = (
+    "OMP_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+    "VECLIB_MAXIMUM_THREADS",
+)
+
+
+def thread_budget(workers: int, cpu_count: int | None = None) -> int:
+    """Split the machine's cores evenly across `workers` processes (at least one each)."""
+    cpus = cpu_count or os.cpu_count() or 1
+    return max(1, cpus // max(1, workers))
+
+
+def set_thread_env(threads: int) -> None:
+    """Export per-process thread limits; must run before torch/numpy are imported."""
+    for var in THREAD_ENV_VARS:
+        os.environ[var] = str(threads)
+    # HF tokenizers spawn their own pool and warn after fork otherwise
+    os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+
+def apply_thread_budget(threads: int) -> None:
+    """Limit torch intra-op threads in this process (call in each worker after fork)."""
+    set_thread_env(threads)
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        return
+    logging.info(f"Torch limited to {threads} thread(s) in pid {os.getpid()}")
+
+
+def page_in(path: str | Path, chunk_size: int = 1 << 20) -> int:
+    """Read every file under `path` so it sits in the OS page cache shared by all workers.
+
+    Returns:
+        Number of bytes read
+    """
+    total = 0
+    root = Path(path)
+    if not root.exists():
+        return 0
+    for file in root.rglob("*"):
+        if not file.is_file():
+            continue
+        try:
+            with file.open("rb") as fh:
+                while True:
+                    chunk = fh.read(chunk_size)
+                    if not chunk:
+                        break
+                    total += len(chunk)
+        except OSError:
+            continue
+    return total
@@ -0,0 +1,147 @@
+"""Admission control for LLM generation: bounded concurrency, a bounded priority queue and deadlines."""
+
+from __future__ import annotations
+import heapq
+import itertools
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+# Lower value = served first
+PRIORITY_HIGH = 0    # cheap-prefill turns, e.g. session follow-ups
+PRIORITY_NORMAL = 1  # fresh interactive questions
+PRIORITY_LOW = 2     # background work such as pre-generation
+
+
+class SchedulerError(RuntimeError):
+    """Base for requests the scheduler refuses; `retry_after` is a hint in seconds."""
+
+    def __init__(self, message: str, retry_after: int) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class QueueFullError(SchedulerError):
+    """The wait queue is at capacity; the request was rejected immediately."""
+
+
+class QueueTimeoutError(SchedulerError):
+    """The request's deadline passed before a generation slot became free."""
+
+
+class GenerationScheduler:
+    def __init__(self, max_concurrency: int = 2, max_queue: int = 16, queue_timeout: Optional[float] = 10.0) -> None:
+        """Gate calls to the LLM.
+
+        Args:
+            max_concurrency: Generations allowed to run at once
+            max_queue: Requests allowed to wait for a slot; beyond this they are rejected
+            queue_timeout: Default seconds a request may wait (None waits indefinitely)
+        """
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self._cond = threading.Condition()
+        self._waiting: List[tuple] = []  # heap of (priority, seq)
+        self._seq = itertools.count()
+        self._active = 0
+        self._stats = {"admitted": 0, "rejected": 0, "timed_out": 0, "completed": 0}
+        self._wait_avg = 0.0
+        self._wait_max = 0.0
+        self._service_avg = 0.0
+
+    def _retry_after(self) -> int:
+        # Time for the current backlog to drain at the observed service rate
+        backlog = len(self._waiting) + self._active
+        service = self._service_avg or 5.0
+        return max(1, math.ceil(service * backlog / self.max_concurrency))
+
+    def acquire(self, priority: int = PRIORITY_NORMAL, timeout: Optional[float] = None) -> float:
+        """Block until a slot is free for this request.
+
+        Args:
+            priority: PRIORITY_* value; lower is served first, FIFO within a priority
+            timeout: Seconds this request may wait (defaults to `queue_timeout`)
+
+        Returns:
+            Seconds spent waiting
+
+        Raises:
+            QueueFullError: The wait queue is full
+            QueueTimeoutError: No slot became free before the deadline
+        """
+        timeout = self.queue_timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = None if timeout is None else start + timeout
+        with self._cond:
+            if self._active < self.max_concurrency and not self._waiting:
+                self._active += 1
+                self._stats["admitted"] += 1
+                self._record_wait(0.0)
+                return 0.0
+            if len(self._waiting) >= self.max_queue:
+                self._stats["rejected"] += 1
+                raise QueueFullError("Generation queue is full", self._retry_after())
+
+            entry = (priority, next(self._seq))
+            heapq.heappush(self._waiting, entry)
+            try:
+                while not (self._active < self.max_concurrency and self._waiting[0] == entry):
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        self._stats["timed_out"] += 1
+                        raise QueueTimeoutError("Timed out waiting for a generation slot", self._retry_after())
+                    self._cond.wait(remaining)
+            except BaseException:
+                self._waiting.remove(entry)
+                heapq.heapify(self._waiting)
+                # The head may have changed; let the next waiter re-check
+                self._cond.notify_all()
+                raise
+            heapq.heappop(self._waiting)
+            self._active += 1
+            self._stats["admitted"] += 1
+            waited = time.monotonic() - start
+            self._record_wait(waited)
+            # Another slot may still be free for the new head of the queue
+            self._cond.notify_all()
+            return waited
+
+    def release(self, service_time: Optional[float] = None) -> None:
+        """Free a slot taken by `acquire`."""
+        with self._cond:
+            self._active -= 1
+            self._stats["completed"] += 1
+            if service_time is not None:
+                self._service_avg = service_time if not self._service_avg else 0.9 * self._service_avg + 0.1 * service_time
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, priority: int = PRIORITY_NORMAL, timeout: Optional[float] = None) -> Iterator[float]:
+        """Hold a generation slot for the duration of the block; yields the wait time."""
+        waited = self.acquire(priority, timeout)
+        start = time.monotonic()
+        try:
+            yield waited
+        finally:
+            self.release(time.monotonic() - start)
+
+    def _record_wait(self, waited: float) -> None:
+        self._wait_avg = 0.9 * self._wait_avg + 0.1 * waited
+        self._wait_max = max(self._wait_max, waited)
+
+    def stats(self) -> Dict[str, float]:
+        """Queue depth, in-flight generations and wait times for monitoring."""
+        with self._cond:
+            return {
+                **self._stats,
+                "queue_depth": len(self._waiting),
+                "in_flight": self._active,
+                "max_concurrency": self.max_concurrency,
+                "max_queue": self.max_queue,
+                "avg_wait_ms": round(self._wait_avg * 1000, 1),
+                "max_wait_ms": round(self._wait_max * 1000, 1),
+                "avg_service_ms": round(self._service_avg * 1000, 1),
+            }
@@ -0,0 +1,167 @@
+"""Bounded server-side chat sessions for multi-turn questions."""
+
+from __future__ import annotations
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+# Openers and pronouns that only make sense relative to the previous turn
+_FOLLOWUP_OPENER_RE = re.compile(r"^\s*(what|how)\s+about\b|^\s*(and|also|but|so|then|or)\b", re.IGNORECASE)
+_FOLLOWUP_PRONOUN_RE = re.compile(r"\b(it|its|that|this|those|these|they|them|their|there|one)\b", re.IGNORECASE)
+
+
+@dataclass
+class Session:
+    session_id: str
+    # Ollama conversation (system, then alternating user/assistant); resent verbatim so the
+    # server can reuse the already-evaluated prefix instead of prefilling it again
+    messages: List[dict] = field(default_factory=list)
+    # Last standalone (non follow-up) question, used to condense follow-ups; chains of
+    # follow-ups are all condensed against it so the retrieval query never keeps growing
+    last_query: Optional[str] = None
+    # Documents placed in the conversation, per retained turn; follow-ups only send new ones
+    turn_docs: List[List[str]] = field(default_factory=list)
+    turns: int = 0
+    last_used: float = field(default_factory=time.monotonic)
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def seen_docs(self) -> set:
+        """Documents the model can still see in the retained conversation."""
+        return {doc for docs in self.turn_docs for doc in docs}
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count for budgeting prompts (about 3 characters per token, erring high)."""
+    return len(text) // 3 + 4
+
+
+def is_followup(question: str, session: Session) -> bool:
+    """Whether `question` leans on the previous turn of `session`."""
+    if session.last_query is None:
+        return False
+    if _FOLLOWUP_OPENER_RE.search(question):
+        return True
+    return len(question.split()) <= 6 and bool(_FOLLOWUP_PRONOUN_RE.search(question))
+
+
+def condense_question(question: str, session: Session) -> str:
+    """Rewrite a follow-up into a standalone retrieval query.
+
+    "what about concession fares?" after "How much does a Myki cost?"
+    becomes "How much does a Myki cost? what about concession fares?",
+    which embeds close to the FAQ rows the follow-up is about.
+    """
+    if not is_followup(question, session):
+        return question
+    return f"{session.last_query} {question}"
+
+
+class SessionStore:
+    def __init__(self, max_sessions: int = 1000, idle_seconds: float = 1800, max_turns: int = 4) -> None:
+        """LRU-bounded session table with idle expiry.
+
+        Args:
+            max_sessions: Sessions kept before the least recently used is evicted
+            idle_seconds: Sessions unused for this long are dropped
+            max_turns: Conversation turns kept per session (older turns are trimmed)
+        """
+        self.max_sessions = max_sessions
+        self.idle_seconds = idle_seconds
+        self.max_turns = max_turns
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"created": 0, "evicted": 0, "expired": 0}
+
+    def _evict(self, now: float) -> None:
+        # Oldest first: stop at the first session that is still fresh
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if now - session.last_used < self.idle_seconds:
+                break
+            del self._sessions[session_id]
+            self._stats["expired"] += 1
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+            self._stats["evicted"] += 1
+
+    def get(self, session_id: str) -> Optional[Session]:
+        """Return a live session and mark it as recently used."""
+        now = time.monotonic()
+        with self._lock:
+            self._evict(now)
+            session = self._sessions.get(session_id)
+            if session is not None:
+                session.last_used = now
+                self._sessions.move_to_end(session_id)
+            return session
+
+    def get_or_create(self, session_id: Optional[str] = None) -> Session:
+        """Return the session for `session_id`, or start a new one if it is unknown or expired."""
+        if session_id:
+            session = self.get(session_id)
+            if session is not None:
+                return session
+        session = Session(session_id=uuid.uuid4().hex)
+        with self._lock:
+            self._sessions[session.session_id] = session
+            self._stats["created"] += 1
+            self._evict(time.monotonic())
+        return session
+
+    def delete(self, session_id: str) -> bool:
+        """Forget a session; returns whether it existed."""
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def record_turn(
+        self,
+        session: Session,
+        question: str,
+        user_message: dict,
+        answer: str,
+        new_docs: List[str],
+        followup: bool = False,
+    ) -> None:
+        """Append a completed turn, trimming the oldest turns beyond `max_turns`.
+
+        Only a standalone `question` becomes the anchor that later follow-ups
+        are condensed against.
+        """
+        session.messages.extend([user_message, {"role": "assistant", "content": answer}])
+        session.turn_docs.append(list(new_docs))
+        if not followup:
+            session.last_query = question
+        session.turns += 1
+        # messages[0] is the system prompt; each turn adds a user/assistant pair
+        self._drop_oldest_turns(session, len(session.turn_docs) - self.max_turns)
+
+    def fit_history(self, session: Session, budget_tokens: int) -> int:
+        """Drop the oldest turns until the conversation fits in `budget_tokens`.
+
+        Returns:
+            Number of turns dropped
+        """
+        used = sum(estimate_tokens(message["content"]) for message in session.messages)
+        dropped = 0
+        while session.turn_docs and used > budget_tokens:
+            used -= sum(estimate_tokens(message["content"]) for message in session.messages[1:3])
+            self._drop_oldest_turns(session, 1)
+            dropped += 1
+        return dropped
+
+    @staticmethod
+    def _drop_oldest_turns(session: Session, count: int) -> None:
+        if count <= 0:
+            return
+        del session.messages[1:1 + 2 * count]
+        # Documents from dropped turns are no longer visible to the model
+        del session.turn_docs[:count]
+
+    def stats(self) -> Dict[str, int]:
+        """Session counts for monitoring."""
+        with self._lock:
+            return {**self._stats, "active": len(self._sessions)}
@@ -0,0 +1,133 @@
+"""Versioned, immutable index snapshots with an atomically updated CURRENT pointer."""
+
+from __future__ import annotations
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+SNAPSHOTS_DIR = "snapshots"
+CURRENT_FILE = "CURRENT"
+MANIFEST_FILE = "manifest.json"
+
+
+def snapshots_root(chroma_dir: str | Path) -> Path:
+    """Directory holding one sub-directory per snapshot version."""
+    return Path(chroma_dir) / SNAPSHOTS_DIR
+
+
+def snapshot_path(chroma_dir: str | Path, version: str) -> Path:
+    """Chroma persist directory of a snapshot version."""
+    return snapshots_root(chroma_dir) / version
+
+
+def new_snapshot(chroma_dir: str | Path) -> Tuple[str, Path]:
+    """Create an empty directory for a new snapshot.
+
+    Returns:
+        (version, path) where version is a sortable UTC timestamp
+    """
+    version = time.strftime("%Y%m%dT%H%M%SZ", time.gmtime())
+    path = snapshot_path(chroma_dir, version)
+    suffix = 1
+    while path.exists():
+        path = snapshot_path(chroma_dir, f"{version}-{suffix}")
+        suffix += 1
+    path.mkdir(parents=True)
+    return path.name, path
+
+
+def _atomic_write(path: Path, text: str) -> None:
+    tmp = path.with_name(f".{path.name}.tmp")
+    with tmp.open("w", encoding="utf-8") as fh:
+        fh.write(text)
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(tmp, path)
+
+
+def write_manifest(path: str | Path, manifest: dict) -> None:
+    """Write a snapshot's manifest; a snapshot without one is treated as incomplete."""
+    _atomic_write(Path(path) / MANIFEST_FILE, json.dumps(manifest, indent=2, sort_keys=True))
+
+
+def read_manifest(path: str | Path) -> Optional[dict]:
+    """Read a snapshot's manifest, or None if the snapshot is incomplete."""
+    manifest_file = Path(path) / MANIFEST_FILE
+    if not manifest_file.exists():
+        return None
+    with manifest_file.open("r", encoding="utf-8") as fh:
+        return json.load(fh)
+
+
+def publish(chroma_dir: str | Path, version: str) -> None:
+    """Point CURRENT at `version`; readers polling CURRENT will switch to it."""
+    if read_manifest(snapshot_path(chroma_dir, version)) is None:
+        raise ValueError(f"Snapshot {version} has no manifest and cannot be published")
+    _atomic_write(snapshots_root(chroma_dir) / CURRENT_FILE, version + "\n")
+
+
+def current_version(chroma_dir: str | Path) -> Optional[str]:
+    """Version named by CURRENT, or None if no snapshot was ever published."""
+    current_file = snapshots_root(chroma_dir) / CURRENT_FILE
+    if not current_file.exists():
+        return None
+    version = current_file.read_text(encoding="utf-8").strip()
+    return version or None
+
+
+def resolve_index(chroma_dir: str | Path, version: Optional[str] = None) -> Tuple[Path, Optional[dict]]:
+    """Locate the index to serve.
+
+    Returns the persist directory and manifest of `version` (default: CURRENT).
+    Falls back to `chroma_dir` itself with no manifest for indexes built
+    before snapshots existed.
+    """
+    version = version or current_version(chroma_dir)
+    if version is None:
+        return Path(chroma_dir), None
+    path = snapshot_path(chroma_dir, version)
+    manifest = read_manifest(path)
+    if manifest is None:
+        raise FileNotFoundError(f"Snapshot {version} not found or incomplete under {snapshots_root(chroma_dir)}")
+    return path, manifest
+
+
+def list_snapshots(chroma_dir: str | Path) -> List[dict]:
+    """Manifests of all complete snapshots, oldest first."""
+    root = snapshots_root(chroma_dir)
+    if not root.exists():
+        return []
+    manifests = []
+    for path in sorted(p for p in root.iterdir() if p.is_dir()):
+        manifest = read_manifest(path)
+        if manifest is not None:
+            manifests.append(manifest)
+    return manifests
+
+
+def prune_snapshots(chroma_dir: str | Path, keep: int) -> List[str]:
+    """Delete all but the newest `keep` snapshots, never touching CURRENT or the one before it.
+
+    The previous snapshot stays because servers that have not polled CURRENT
+    since it was published still have it open.
+
+    Returns:
+        Versions that were removed
+    """
+    root = snapshots_root(chroma_dir)
+    if keep < 1 or not root.exists():
+        return []
+    current = current_version(chroma_dir)
+    versions = sorted(p.name for p in root.iterdir() if p.is_dir())
+    older = [version for version in versions if current is not None and version < current]
+    protected = {current, older[-1] if older else None}
+    removed = []
+    for version in versions[:-keep]:
+        if version in protected:
+            continue
+        shutil.rmtree(root / version, ignore_errors=True)
+        removed.append(version)
+    return removed
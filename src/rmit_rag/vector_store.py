@@ -1,15 +1,27 @@
 from __future__ import annotations
-from typing import Sequence
+from typing import Dict, Sequence
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
 import chromadb
 from chromadb.config import Settings
+from .snapshots import resolve_index
+from .profiling import running_inline
+from .projection import load_projection, project_queries, projection_path
 
 
 class VectorStore:
-    def __init__(self, collection_name: str, persist_directory: str | Path = "chroma") -> None:
+    def __init__(self, collection_name: str, persist_directory: str | Path = "chroma", *, use_projection: bool = True) -> None:
         """Persistent Chroma collection wrapper.
 
         Creates/loads a named collection stored under `persist_directory`.
+        If the collection was built with reduced embeddings, its saved
+        projection is loaded and applied to full-size query embeddings.
         """
         # Ensure the directory exists before initializing the client
         persist_path = Path(persist_directory)
@@ -20,6 +32,8 @@ class VectorStore:
             settings=Settings(anonymized_telemetry=False),
         )
         self._collection = self._client.get_or_create_collection(collection_name)
+        self.persist_directory = persist_path
+        self.projection = load_projection(projection_path(persist_path, collection_name)) if use_projection else None
 
     @property
     def collection(self):
@@ -38,9 +52,313 @@ class VectorStore:
     def query(self, *, query_embeddings: Sequence[Sequence[float]], n_results: int = 5):
         """Retrieve top matches for the given query embeddings."""
         return self._collection.query(
-            query_embeddings=list(query_embeddings), 
+            query_embeddings=project_queries(self.projection, query_embeddings), 
             n_results=n_results,
             include=["documents", "metadatas", "distances"],  # Only get what we need
             # Optimize for speed - disable metadata filtering if not needed
             where=None,  # No metadata filtering for faster queries
         )
+
+    def get_all(self) -> dict:
+        """Return every stored entry's ids, documents and metadatas."""
+        return self._collection.get(include=["documents", "metadatas"])
+
+    def fingerprint(self) -> str:
+        """Content hash of the collection, used as its index version.
+
+        Stable across processes as long as the stored ids, documents and
+        metadatas are unchanged.
+        """
+        data = self.get_all()
+        ids = data.get("ids") or []
+        documents = data.get("documents") or [None] * len(ids)
+        metadatas = data.get("metadatas") or [None] * len(ids)
+        digest = hashlib.sha256()
+        for id_, doc, meta in sorted(zip(ids, documents, metadatas), key=lambda row: row[0]):
+            digest.update(json.dumps([id_, doc, meta], sort_keys=True, ensure_ascii=False).encode())
+        return digest.hexdigest()
+
+
+SHARD_SEPARATOR = "__"
+# Separates a shard's label from its build generation; never produced by `shard_label`
+GENERATION_SEPARATOR = "."
+
+
+def shard_label(source: str) -> str:
+    """Normalize a source label into a Chroma-safe shard suffix (e.g. "housing (1)" -> "housing_1")."""
+    label = re.sub(r"[^A-Za-z0-9_-]+", "_", str(source)).strip("_-")
+    return label or "qa"
+
+
+def shard_collection_name(collection_name: str, source: str, generation: str | None = None) -> str:
+    """Name of the collection backing one shard, optionally for a specific build `generation`."""
+    name = f"{collection_name}{SHARD_SEPARATOR}{shard_label(source)}"
+    return f"{name}{GENERATION_SEPARATOR}{generation}" if generation else name
+
+
+def new_generation() -> str:
+    """Sortable id for a shard rebuild; later builds compare greater."""
+    return str(time.time_ns())
+
+
+class ShardedVectorStore:
+    def __init__(
+        self,
+        collection_name: str,
+        persist_directory: str | Path = "chroma",
+        *,
+        shards: Sequence[str] | None = None,
+        max_workers: int | None = None,
+    ) -> None:
+        """One Chroma collection per source label, searched in parallel.
+
+        Shards are the collections named `<collection_name>__<label>` under
+        `persist_directory`; a rebuilt shard gets a new collection
+        `<collection_name>__<label>.<generation>` and the newest generation
+        of each label is the one served. Pass `shards` to open only those
+        labels. Queries fan out to every open shard (or the requested
+        `sources`) on a thread pool and the per-shard hits are merged by
+        distance; a shard that fails is logged and left out.
+        """
+        self.collection_name = collection_name
+        self._persist_directory = Path(persist_directory)
+        self._persist_directory.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._shards: Dict[str, VectorStore] = {}
+        # All shards share one projection, applied once before the fan-out
+        self.persist_directory = self._persist_directory
+        self.projection = load_projection(projection_path(self._persist_directory, collection_name))
+
+        generations = self._generations()
+        labels = [shard_label(s) for s in shards] if shards is not None else sorted(generations)
+        for label in labels:
+            names = generations.get(label)
+            self._shards[label] = self._open(names[-1] if names else shard_collection_name(collection_name, label))
+        self._pool = ThreadPoolExecutor(
+            max_workers=max_workers or max(1, min(8, len(self._shards) or 1)),
+            thread_name_prefix="shard-query",
+        )
+
+    def _client(self):
+        return chromadb.PersistentClient(
+            path=str(self._persist_directory),
+            settings=Settings(anonymized_telemetry=False),
+        )
+
+    def _generations(self) -> Dict[str, list[str]]:
+        """Collection names on disk per shard label, oldest generation first."""
+        prefix = f"{self.collection_name}{SHARD_SEPARATOR}"
+        # Chroma <0.6 returns Collection objects, newer versions return names
+        names = [getattr(c, "name", c) for c in self._client().list_collections()]
+        generations: Dict[str, list[tuple[str, str]]] = {}
+        for name in names:
+            if not name.startswith(prefix):
+                continue
+            label, _, generation = name[len(prefix):].partition(GENERATION_SEPARATOR)
+            # The unversioned collection predates any generation
+            generations.setdefault(label, []).append((generation, name))
+        return {label: [name for _, name in sorted(entries)] for label, entries in generations.items()}
+
+    def _open(self, name: str) -> VectorStore:
+        return VectorStore(name, persist_directory=self._persist_directory, use_projection=False)
+
+    @property
+    def shards(self) -> Dict[str, VectorStore]:
+        """Snapshot of the currently active shards keyed by label."""
+        return dict(self._shards)
+
+    def shard(self, source: str) -> VectorStore:
+        """Return the shard for `source`, creating its collection if needed."""
+        label = shard_label(source)
+        with self._lock:
+            if label not in self._shards:
+                names = self._generations().get(label)
+                shards = dict(self._shards)
+                shards[label] = self._open(names[-1] if names else shard_collection_name(self.collection_name, label))
+                self._shards = shards
+            return self._shards[label]
+
+    def new_shard(self, source: str) -> VectorStore:
+        """Create an empty collection for a new generation of `source`, without serving it yet.
+
+        Fill it, then `swap_shard` it in; other processes pick it up through
+        `reload_shard`/`refresh` since it is now the newest generation.
+        """
+        return self._open(shard_collection_name(self.collection_name, source, new_generation()))
+
+    def swap_shard(self, source: str, store: VectorStore) -> VectorStore | None:
+        """Atomically replace one shard; other shards and in-flight queries are untouched.
+
+        Returns the previously active store for that label, if any.
+        """
+        label = shard_label(source)
+        with self._lock:
+            shards = dict(self._shards)
+            previous = shards.get(label)
+            shards[label] = store
+            # Rebind rather than mutate so concurrent queries keep iterating their own snapshot
+            self._shards = shards
+        return previous
+
+    def reload_shard(self, source: str) -> VectorStore | None:
+        """Open the newest generation of one shard from disk and swap it in."""
+        label = shard_label(source)
+        names = self._generations().get(label)
+        if not names:
+            return self.drop_shard(label, delete=False)
+        active = self._shards.get(label)
+        if active is not None and active.collection.name == names[-1]:
+            return None
+        return self.swap_shard(label, self._open(names[-1]))
+
+    def refresh(self, sources: Sequence[str] | None = None) -> list[str]:
+        """Follow rebuilds made by other processes: serve the newest generation of every shard.
+
+        Pass `sources` to refresh only those labels.
+
+        Returns:
+            Labels that were swapped in, reopened or dropped
+        """
+        # A full rebuild may also have refitted the shared projection
+        self.projection = load_projection(projection_path(self._persist_directory, self.collection_name))
+        generations = self._generations()
+        changed = []
+        labels = set(generations) | set(self._shards)
+        if sources:
+            labels &= {shard_label(source) for source in sources}
+        for label in sorted(labels):
+            names = generations.get(label)
+            active = self._shards.get(label)
+            if active is not None and names and active.collection.name == names[-1]:
+                continue
+            self.reload_shard(label)
+            changed.append(label)
+        return changed
+
+    def prune_shard(self, source: str, keep: int = 2) -> list[str]:
+        """Delete all but the newest `keep` generations of one shard.
+
+        The default keeps the generation just replaced, so processes that
+        have not refreshed yet keep serving it.
+
+        Returns:
+            Names of the deleted collections
+        """
+        names = self._generations().get(shard_label(source), [])
+        stale = names[:-keep] if keep > 0 else names
+        client = self._client()
+        for name in stale:
+            client.delete_collection(name)
+        return stale
+
+    def drop_shard(self, source: str, delete: bool = True) -> VectorStore | None:
+        """Stop serving one shard and, with `delete`, remove all its generations from disk."""
+        label = shard_label(source)
+        with self._lock:
+            shards = dict(self._shards)
+            previous = shards.pop(label, None)
+            self._shards = shards
+        if delete:
+            self.prune_shard(label, keep=0)
+        return previous
+
+    def clear(self) -> None:
+        """Drop every shard."""
+        for label in list(self._generations()):
+            self.drop_shard(label)
+
+    def add(self, *, documents: Sequence[str], embeddings: Sequence[Sequence[float]], ids: Sequence[str], metadatas: Sequence[dict] | None = None) -> None:
+        """Route each document to the shard named by its metadata `source`."""
+        groups: Dict[str, list[int]] = {}
+        for i in range(len(documents)):
+            source = (metadatas[i] or {}).get("source", "qa") if metadatas is not None else "qa"
+            groups.setdefault(shard_label(source), []).append(i)
+        for label, idxs in groups.items():
+            self.shard(label).add(
+                documents=[documents[i] for i in idxs],
+                embeddings=[embeddings[i] for i in idxs],
+                ids=[ids[i] for i in idxs],
+                metadatas=[metadatas[i] for i in idxs] if metadatas is not None else None,
+            )
+
+    def query(self, *, query_embeddings: Sequence[Sequence[float]], n_results: int = 5, sources: Sequence[str] | None = None):
+        """Fan the query out to the relevant shards and merge the top `n_results` by distance."""
+        if isinstance(sources, str):
+            raise TypeError("sources must be a list of source labels, not a string")
+        shards = self.shards
+        if sources:
+            wanted = {shard_label(s) for s in sources}
+            shards = {label: store for label, store in shards.items() if label in wanted}
+        query_embeddings = project_queries(self.projection, query_embeddings)
+        merged = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        if not shards:
+            for key in merged:
+                merged[key] = [[] for _ in query_embeddings]
+            return merged
+
+        def _search(item: tuple[str, VectorStore]) -> dict:
+            label, store = item
+            try:
+                # Chroma caps n_results at the collection size itself
+                return store.query(query_embeddings=query_embeddings, n_results=n_results)
+            except Exception as e:
+                # e.g. the collection was replaced by a rebuild this process has not picked up yet
+                logging.warning(f"Shard {label} query failed, leaving it out: {e}")
+                return {}
+
+        # A deterministic profile only sees its own thread, so search the shards there
+        searches = map(_search, shards.items()) if running_inline() else self._pool.map(_search, shards.items())
+        partials = [r for r in searches if r]
+        for qi in range(len(query_embeddings)):
+            hits = []
+            for r in partials:
+                for j, distance in enumerate(r["distances"][qi]):
+                    hits.append((distance, r["ids"][qi][j], r["documents"][qi][j], r["metadatas"][qi][j]))
+            hits.sort(key=lambda hit: hit[0])
+            top = hits[:n_results]
+            merged["distances"].append([h[0] for h in top])
+            merged["ids"].append([h[1] for h in top])
+            merged["documents"].append([h[2] for h in top])
+            merged["metadatas"].append([h[3] for h in top])
+        return merged
+
+    def get_all(self) -> dict:
+        """Return every stored entry across shards."""
+        merged = {"ids": [], "documents": [], "metadatas": []}
+        for label, store in sorted(self.shards.items()):
+            data = store.get_all()
+            merged["ids"].extend(f"{label}/{id_}" for id_ in data.get("ids") or [])
+            merged["documents"].extend(data.get("documents") or [])
+            merged["metadatas"].extend(data.get("metadatas") or [])
+        return merged
+
+    def fingerprint(self) -> str:
+        """Combined content hash of all shards."""
+        digest = hashlib.sha256()
+        for label, store in sorted(self.shards.items()):
+            digest.update(f"{label}:{store.fingerprint()}".encode())
+        return digest.hexdigest()
+
+
+def open_store(
+    collection_name: str,
+    chroma_dir: str | Path,
+    *,
+    sharded: bool = False,
+    version: str | None = None,
+) -> tuple[VectorStore | ShardedVectorStore, dict | None]:
+    """Open the published snapshot `version` (default: CURRENT) of `collection_name`.
+
+    Without any published snapshot, opens the collection directly under
+    `chroma_dir`. A snapshot's manifest decides whether it is sharded.
+
+    Returns:
+        (store, manifest) where manifest is None for unversioned indexes
+    """
+    path, manifest = resolve_index(chroma_dir, version)
+    if manifest is not None:
+        collection_name = manifest.get("collection", collection_name)
+        sharded = bool(manifest.get("sharded", False))
+    if sharded:
+        return ShardedVectorStore(collection_name, persist_directory=path), manifest
+    return VectorStore(collection_name, persist_directory=path), manifest